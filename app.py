@@ -7,69 +7,430 @@ Architect 3D Home Modeler – Powered by Google AI (Complete & Verified UI Updat
 
 import os
 import sqlite3
+import logging
 import uuid
 import json
 import base64
 import re
-from datetime import datetime
-from functools import wraps
+import time
+import hashlib
+import hmac
+import random
+import threading
+import itertools
+import math
+import zipfile
+import queue
+import atexit
+import sys
+import tempfile
+from bisect import bisect_left
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from functools import wraps, lru_cache
 from pathlib import Path
+from io import BytesIO
 from email.utils import formataddr
 
 from flask import (
-    Flask, request, render_template, redirect, url_for,
-    flash, session, send_from_directory, jsonify
+    Flask, Blueprint, request, render_template, redirect, url_for,
+    flash, session, send_from_directory, send_file, jsonify, abort, g, has_app_context,
+    Response, stream_with_context
 )
+import click
 from werkzeug.security import generate_password_hash, check_password_hash
-from PIL import Image as PILImage, ImageDraw
+from PIL import Image as PILImage, ImageDraw, PngImagePlugin, features as pil_features
 from email.message import EmailMessage
 import smtplib
 
-import vertexai
-from vertexai.vision_models import ImageGenerationModel, Image as GoogleAIImage
 
 # ---------- Config ----------
 APP_NAME = "Architect 3D Home Modeler"
 BASE_DIR = Path(__file__).resolve().parent
-DB_PATH = BASE_DIR / "architect.db"
+DB_PATH = Path(os.getenv("DB_PATH", BASE_DIR / "architect.db"))
 UPLOAD_DIR = BASE_DIR / "uploads"
 RENDER_DIR = BASE_DIR / "static" / "renderings"
 STATIC_DIR = BASE_DIR / "static"
 TEMPLATES_DIR = BASE_DIR / "templates"
+RENDER_CACHE_DIR = BASE_DIR / "render_cache"
+DERIVED_DIR = BASE_DIR / "derived"
+
+# --- Responsive image derivatives ---
+RESPONSIVE_WIDTHS = (320, 640, 1280)
+DERIVED_FORMAT = "WEBP" if pil_features.check("webp") else "JPEG"
+DERIVED_MIMETYPE = "image/webp" if DERIVED_FORMAT == "WEBP" else "image/jpeg"
+DERIVED_QUALITY = int(os.getenv("DERIVED_QUALITY", "80"))
 
 # --- Google Cloud Project Configuration ---
 GCP_PROJECT_ID = os.getenv("GCP_PROJECT_ID")
 GCP_LOCATION = os.getenv("GCP_LOCATION", "us-central1")
+IMAGE_MODEL_VERSION = os.getenv("IMAGE_MODEL_VERSION", "imagegeneration@006")
+VERTEX_PREWARM = os.getenv("VERTEX_PREWARM", "0") == "1"
+RENDER_ASPECT_RATIO = "16:9"
+
+# --- Image backend (vertex | fake) ---
+IMAGE_BACKEND = os.getenv("IMAGE_BACKEND", "vertex")
+FAKE_BACKEND_LATENCY_MS = int(os.getenv("FAKE_BACKEND_LATENCY_MS", "1500"))
+FAKE_BACKEND_JITTER_MS = int(os.getenv("FAKE_BACKEND_JITTER_MS", "500"))
+FAKE_BACKEND_FAILURE_RATE = float(os.getenv("FAKE_BACKEND_FAILURE_RATE", "0"))
+FAKE_BACKEND_SEED = os.getenv("FAKE_BACKEND_SEED")
+
+# --- Admission control and backend resilience ---
+# Token buckets are per process: divide by the worker count for a fleet-wide budget.
+RATE_LIMIT_USER_PER_MINUTE = float(os.getenv("RATE_LIMIT_USER_PER_MINUTE", "10"))
+RATE_LIMIT_USER_BURST = int(os.getenv("RATE_LIMIT_USER_BURST", "20"))
+RATE_LIMIT_GLOBAL_PER_MINUTE = float(os.getenv("RATE_LIMIT_GLOBAL_PER_MINUTE", "120"))
+RATE_LIMIT_GLOBAL_BURST = int(os.getenv("RATE_LIMIT_GLOBAL_BURST", "60"))
+BACKEND_MAX_RETRIES = int(os.getenv("BACKEND_MAX_RETRIES", "3"))
+BACKEND_RETRY_BASE_SECONDS = float(os.getenv("BACKEND_RETRY_BASE_SECONDS", "1.0"))
+BACKEND_RETRY_MAX_SECONDS = float(os.getenv("BACKEND_RETRY_MAX_SECONDS", "20"))
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("BREAKER_RESET_SECONDS", "30"))
+
+# --- Render storage ---
+# Files are always fsynced inline before the rename (when RENDER_STORE_FSYNC is on);
+# RENDER_STORE_WRITE_BEHIND only moves RENDER_RECOMPRESS off the request path.
+RENDER_STORE_FSYNC = os.getenv("RENDER_STORE_FSYNC", "1") == "1"
+RENDER_STORE_WRITE_BEHIND = os.getenv("RENDER_STORE_WRITE_BEHIND", "1") == "1"
+RENDER_RECOMPRESS = os.getenv("RENDER_RECOMPRESS", "0") == "1"
+
+# --- Render cache ---
+RENDER_CACHE_ENABLED = os.getenv("RENDER_CACHE_ENABLED", "0") == "1"
+RENDER_CACHE_MAX_BYTES = int(os.getenv("RENDER_CACHE_MAX_MB", "1024")) * 1024 * 1024
+
+# --- SQLite ---
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_STATEMENT_CACHE = int(os.getenv("SQLITE_STATEMENT_CACHE", "256"))
+SQLITE_CACHE_KB = int(os.getenv("SQLITE_CACHE_KB", "16384"))
+
+# --- Render job queue ---
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", "4"))
+RENDER_QUEUE_LIMIT = int(os.getenv("RENDER_QUEUE_LIMIT", "100"))
+RENDER_JOB_TIMEOUT = int(os.getenv("RENDER_JOB_TIMEOUT", "900"))
+RENDER_FANOUT_LIMIT = int(os.getenv("RENDER_FANOUT_LIMIT", "4"))
 
-# Create Flask app
-app = Flask(__name__, template_folder=str(TEMPLATES_DIR), static_folder=str(STATIC_DIR))
-app.config["SECRET_KEY"] = os.getenv("SECRET_KEY") or os.urandom(32)
-app.config.setdefault("DB_INITIALIZED", False)
-app.config.setdefault("FS_INITIALIZED", False)
+# --- Guest sessions ---
+GUEST_SESSION_TTL_DAYS = int(os.getenv("GUEST_SESSION_TTL_DAYS", "7"))
+# Renderings listed only in an old-style session cookie (no guest token yet) are
+# adopted when that cookie comes back; keep them longer than the cookie can live
+# (Flask's PERMANENT_SESSION_LIFETIME, 31 days by default) before sweeping them.
+LEGACY_GUEST_GRACE_DAYS = int(os.getenv("LEGACY_GUEST_GRACE_DAYS", "60"))
+PENDING_JOBS_IN_SESSION = 10
+
+# --- Render progress stream ---
+SSE_MAX_SECONDS = int(os.getenv("SSE_MAX_SECONDS", "60"))
+SSE_POLL_SECONDS = float(os.getenv("SSE_POLL_SECONDS", "1.0"))
+SSE_HEARTBEAT_SECONDS = 15
+SSE_BACKLOG_SECONDS = 300
+
+# --- Background maintenance ---
+MAINTENANCE_ENABLED = os.getenv("MAINTENANCE_ENABLED", "1") == "1"
+REAPER_INTERVAL_SECONDS = int(os.getenv("REAPER_INTERVAL_SECONDS", "60"))
+REAPER_BATCH_SIZE = int(os.getenv("REAPER_BATCH_SIZE", "200"))
+SWEEP_INTERVAL_SECONDS = int(os.getenv("SWEEP_INTERVAL_SECONDS", "3600"))
+SWEEP_GRACE_SECONDS = int(os.getenv("SWEEP_GRACE_SECONDS", "3600"))
+JOB_RETENTION_DAYS = int(os.getenv("JOB_RETENTION_DAYS", "30"))
+
+# --- Metrics and profiling ---
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN")
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "20"))
+SLOW_REQUEST_MS = int(os.getenv("SLOW_REQUEST_MS", "2000"))
+
+# --- Startup ---
+SECRET_KEY = os.getenv("SECRET_KEY") or os.urandom(32)
+INIT_ON_STARTUP = os.getenv("INIT_ON_STARTUP", "1") == "1"
+
+# Routes, hooks and CLI commands live on this blueprint; create_app() at the
+# bottom of the module builds the Flask app around it.
+bp = Blueprint("main", __name__, cli_group=None)
+logger = logging.getLogger(__name__)
 
 # ---------- Helpers ----------
 
-def init_fs_once():
+def init_fs():
     """Create necessary directories if they don't exist."""
-    if not app.config["FS_INITIALIZED"]:
-        for p in [UPLOAD_DIR, RENDER_DIR, STATIC_DIR, TEMPLATES_DIR]:
-            p.mkdir(parents=True, exist_ok=True)
-        ico = STATIC_DIR / "favicon.ico"
-        if not ico.exists():
-            img = PILImage.new("RGBA", (32, 32)); d = ImageDraw.Draw(img)
-            d.rectangle([4, 4, 28, 28], fill="#4a6dff"); d.text((8, 8), "A3D", fill="#fff")
-            img.save(ico, format="ICO")
-        app.config["FS_INITIALIZED"] = True
-
-def get_db():
-    conn = sqlite3.connect(DB_PATH)
+    for p in [UPLOAD_DIR, RENDER_DIR, STATIC_DIR, TEMPLATES_DIR, RENDER_CACHE_DIR, DERIVED_DIR]:
+        p.mkdir(parents=True, exist_ok=True)
+    ico = STATIC_DIR / "favicon.ico"
+    if not ico.exists():
+        img = PILImage.new("RGBA", (32, 32)); d = ImageDraw.Draw(img)
+        d.rectangle([4, 4, 28, 28], fill="#4a6dff"); d.text((8, 8), "A3D", fill="#fff")
+        img.save(ico, format="ICO")
+
+# ---------- Metrics ----------
+# Per-process counters, gauges and histograms served in the Prometheus text
+# format at GET /metrics (Bearer METRICS_TOKEN when set). Each gunicorn worker
+# keeps its own values, so scrape every worker and aggregate in Prometheus.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SQL_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1)
+
+_metrics_lock = threading.Lock()
+_metrics = []
+
+def _label_str(labels) -> str:
+    if not labels: return ""
+    esc = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in labels) + "}"
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str):
+        self.name, self.help = name, help_text
+        self.series = {}
+        _metrics.append(self)
+
+    def samples(self) -> list:
+        raise NotImplementedError
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with _metrics_lock:
+            self.series[key] = self.series.get(key, 0) + amount
+
+    def value(self, **labels):
+        with _metrics_lock:
+            return self.series.get(tuple(sorted(labels.items())), 0)
+
+    def samples(self):
+        return [f"{self.name}{_label_str(k)} {v}" for k, v in self.series.items()]
+
+class Gauge(Metric):
+    """Read from a callback at scrape time."""
+    kind = "gauge"
+
+    def __init__(self, name, help_text, read):
+        super().__init__(name, help_text)
+        self.read = read
+
+    def samples(self):
+        return [f"{self.name} {self.read()}"]
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text)
+        self.buckets = buckets
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with _metrics_lock:
+            counts = self.series.get(key)
+            if counts is None:
+                counts = self.series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[bisect_left(self.buckets, value)] += 1
+            counts[-1] += value
+
+    def samples(self):
+        lines = []
+        for key, counts in self.series.items():
+            cumulative = 0
+            for bound, n in zip(self.buckets + ("+Inf",), counts):
+                cumulative += n
+                lines.append(f"{self.name}_bucket{_label_str(key + (('le', bound),))} {cumulative}")
+            lines.append(f"{self.name}_sum{_label_str(key)} {counts[-1]:.6f}")
+            lines.append(f"{self.name}_count{_label_str(key)} {cumulative}")
+        return lines
+
+HTTP_LATENCY = Histogram("architect_http_request_duration_seconds", "Request latency by route, method and status class.")
+BACKEND_LATENCY = Histogram("architect_image_backend_duration_seconds", "Image backend call latency by backend, subcategory and outcome.")
+BACKEND_ERRORS = Counter("architect_image_backend_errors_total", "Failed image backend calls by backend and subcategory.")
+SQL_LATENCY = Histogram("architect_sqlite_query_duration_seconds", "SQLite statement execution time by statement kind and table.", SQL_BUCKETS)
+IMAGE_BYTES = Counter("architect_image_bytes_written_total", "Image bytes written to disk by kind (rendering, derived, cache).")
+RENDER_JOBS = Counter("architect_render_jobs_total", "Finished render jobs by final status.")
+QUEUE_REJECTIONS = Counter("architect_render_queue_rejections_total", "Render jobs refused because the queue was full.")
+Gauge("architect_render_queue_depth", "Render jobs queued or running in this process.", lambda: _pending_jobs)
+
+def render_metrics() -> str:
+    lines = []
+    for metric in _metrics:
+        lines += [f"# HELP {metric.name} {metric.help}", f"# TYPE {metric.name} {metric.kind}"]
+        if isinstance(metric, Gauge):
+            lines += metric.samples()
+        else:
+            with _metrics_lock:
+                lines += metric.samples()
+    return "\n".join(lines) + "\n"
+
+@lru_cache(maxsize=1024)
+def _sql_label(sql: str) -> tuple:
+    verb = sql.split(None, 1)[0].upper() if sql.strip() else "?"
+    match = re.search(r"\b(?:FROM|INTO|UPDATE|TABLE|ON)\s+(?:IF\s+(?:NOT\s+)?EXISTS\s+)?(\w+)", sql, re.IGNORECASE)
+    return verb, match.group(1) if match else ""
+
+def _observe_sql(sql: str, started: float):
+    verb, table = _sql_label(sql)
+    SQL_LATENCY.observe(time.perf_counter() - started, statement=verb, table=table)
+
+class TimedCursor(sqlite3.Cursor):
+    """Times execute(); fetches are not included."""
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            _observe_sql(sql, started)
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            _observe_sql(sql, started)
+
+class TimedConnection(sqlite3.Connection):
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+# --- Sampling profiler ---
+# A request sent with "X-Profile: <PROFILE_TOKEN>" is sampled every
+# PROFILE_INTERVAL_MS from a side thread via sys._current_frames(). The
+# collapsed stacks (flamegraph.pl / speedscope format) are kept in memory for
+# the last PROFILE_KEEP requests and served from /metrics/profiles/<id>.
+# Streaming responses are only sampled until their headers are sent.
+
+_recent_profiles = deque(maxlen=PROFILE_KEEP)
+
+class SamplingProfiler:
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id, self.interval = thread_id, interval
+        self.stacks = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(f"{Path(frame.f_code.co_filename).name}:{frame.f_code.co_name}")
+                frame = frame.f_back
+            if stack:
+                key = ";".join(reversed(stack))
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+
+    def collapsed(self) -> str:
+        return "\n".join(f"{stack} {n}" for stack, n in sorted(self.stacks.items(), key=lambda kv: -kv[1]))
+
+def profile_authorized() -> bool:
+    supplied = request.headers.get("X-Profile", "")
+    return bool(PROFILE_TOKEN) and hmac.compare_digest(supplied.encode(), PROFILE_TOKEN.encode())
+
+@bp.before_app_request
+def start_request_metrics():
+    g.request_started = time.perf_counter()
+    if PROFILE_TOKEN and "X-Profile" in request.headers and profile_authorized():
+        g.profiler = SamplingProfiler(threading.get_ident(), PROFILE_INTERVAL_MS / 1000).start()
+
+@bp.after_app_request
+def record_request_metrics(response):
+    started = g.pop("request_started", None)
+    if started is None: return response
+    elapsed = time.perf_counter() - started
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    if METRICS_ENABLED:
+        HTTP_LATENCY.observe(elapsed, route=route, method=request.method, status=f"{response.status_code // 100}xx")
+    if elapsed * 1000 >= SLOW_REQUEST_MS:
+        logger.warning("Slow request: %s %s took %.0f ms", request.method, request.path, elapsed * 1000)
+    profiler = g.pop("profiler", None)
+    if profiler is not None:
+        profiler.stop()
+        profile_id = uuid.uuid4().hex[:12]
+        _recent_profiles.append({"id": profile_id, "method": request.method, "path": request.path,
+                                 "status": response.status_code, "duration_ms": round(elapsed * 1000, 1),
+                                 "samples": sum(profiler.stacks.values()), "collapsed": profiler.collapsed(),
+                                 "at": datetime.utcnow().isoformat()})
+        response.headers["X-Profile-Id"] = profile_id
+    return response
+
+@bp.get("/metrics")
+def metrics():
+    if not METRICS_ENABLED: abort(404)
+    if METRICS_TOKEN and not hmac.compare_digest(request.headers.get("Authorization", "").encode(), f"Bearer {METRICS_TOKEN}".encode()):
+        abort(401)
+    return Response(render_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+@bp.get("/metrics/profiles")
+def list_profiles():
+    if not profile_authorized(): abort(404)
+    return jsonify([{k: v for k, v in p.items() if k != "collapsed"} for p in reversed(_recent_profiles)])
+
+@bp.get("/metrics/profiles/<profile_id>")
+def get_profile(profile_id):
+    if not profile_authorized(): abort(404)
+    for p in _recent_profiles:
+        if p["id"] == profile_id:
+            return Response(p["collapsed"] + "\n", content_type="text/plain; charset=utf-8")
+    abort(404)
+
+# ---------- Data Access ----------
+# One connection per request (kept on flask.g, closed at teardown) and one
+# long-lived connection per background thread. WAL lets render completions
+# write while gallery requests keep reading, and the statement cache keeps
+# the hot queries prepared across calls on the same connection.
+
+_thread_db = threading.local()
+
+def _connect() -> sqlite3.Connection:
+    conn = sqlite3.connect(DB_PATH, timeout=SQLITE_BUSY_TIMEOUT_MS / 1000, cached_statements=SQLITE_STATEMENT_CACHE,
+                           factory=TimedConnection if METRICS_ENABLED else sqlite3.Connection)
     conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute(f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}")
+    conn.execute(f"PRAGMA cache_size = -{SQLITE_CACHE_KB}")
+    conn.execute("PRAGMA temp_store = MEMORY")
     return conn
 
-def init_db_once():
-    """Initialize SQLite tables once."""
-    if app.config["DB_INITIALIZED"]: return
-    conn = get_db()
+def get_db() -> sqlite3.Connection:
+    """Return the connection for the current request, or for this worker thread outside a request."""
+    if has_app_context():
+        if "db" not in g:
+            g.db = _connect()
+        return g.db
+    conn = getattr(_thread_db, "conn", None)
+    if conn is None:
+        conn = _thread_db.conn = _connect()
+    return conn
+
+def close_db(exc):
+    conn = g.pop("db", None)
+    if conn is not None:
+        if exc is not None: conn.rollback()
+        conn.close()
+
+def _ensure_column(cur, table: str, column: str, decl: str):
+    """Add a column to an existing table; CREATE TABLE IF NOT EXISTS won't."""
+    cur.execute(f"PRAGMA table_info({table})")
+    if column not in {row["name"] for row in cur.fetchall()}:
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+def init_db():
+    """Create tables and apply additive migrations; safe to run on every start."""
+    conn = _connect()
     cur = conn.cursor()
     cur.execute("""
     CREATE TABLE IF NOT EXISTS users (
@@ -83,33 +444,177 @@ def init_db_once():
         image_path TEXT NOT NULL, liked INTEGER DEFAULT 0, favorited INTEGER DEFAULT 0,
         created_at TEXT NOT NULL, FOREIGN KEY(user_id) REFERENCES users(id)
     )""")
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS render_jobs (
+        id TEXT PRIMARY KEY, user_id INTEGER, guest_token TEXT, status TEXT NOT NULL, specs_json TEXT NOT NULL,
+        result_json TEXT, error TEXT, created_at TEXT NOT NULL, started_at TEXT, finished_at TEXT,
+        FOREIGN KEY(user_id) REFERENCES users(id)
+    )""")
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS guest_sessions (
+        token TEXT PRIMARY KEY, created_at TEXT NOT NULL, last_seen_at TEXT NOT NULL, expires_at TEXT NOT NULL
+    )""")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_guest_sessions_expires ON guest_sessions(expires_at)")
+    _ensure_column(cur, "renderings", "guest_token", "TEXT")
+    _ensure_column(cur, "render_jobs", "guest_token", "TEXT")
+    _ensure_column(cur, "renderings", "deleted_at", "TEXT")
+    _ensure_column(cur, "render_jobs", "updated_at", "TEXT")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_render_jobs_status ON render_jobs(status, created_at)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_render_jobs_user_updated ON render_jobs(user_id, updated_at)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_render_jobs_guest_updated ON render_jobs(guest_token, updated_at)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_renderings_user_created ON renderings(user_id, created_at, id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_renderings_user_subcategory ON renderings(user_id, subcategory, created_at, id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_renderings_user_favorited ON renderings(user_id, favorited, created_at, id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_renderings_guest_created ON renderings(guest_token, created_at, id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_renderings_guest_subcategory ON renderings(guest_token, subcategory, created_at, id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_renderings_deleted ON renderings(deleted_at) WHERE deleted_at IS NOT NULL")
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS render_cache (
+        key TEXT PRIMARY KEY, file_name TEXT NOT NULL, size_bytes INTEGER NOT NULL,
+        hits INTEGER DEFAULT 0, created_at TEXT NOT NULL, last_used_at TEXT NOT NULL
+    )""")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_render_cache_lru ON render_cache(last_used_at)")
+    _ensure_column(cur, "renderings", "description", "TEXT")
+    _ensure_column(cur, "renderings", "dhash", "INTEGER")
+    _ensure_column(cur, "renderings", "phash", "INTEGER")
+    _ensure_column(cur, "renderings", "duplicate_of", "INTEGER")
+    _ensure_column(cur, "renderings", "render_key", "TEXT")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_renderings_render_key ON renderings(render_key) WHERE render_key IS NOT NULL")
+    init_search_index(cur)
     conn.commit()
     conn.close()
-    app.config["DB_INITIALIZED"] = True
 
-@app.before_request
+def init_storage():
+    init_fs()
+    init_db()
+
+# Threads don't survive a fork, so background work starts on the first request
+# each worker serves rather than in create_app() (which may run in a gunicorn
+# --preload master).
+_background_started = False
+_background_lock = threading.Lock()
+
+def start_background_once():
+    """Warm the image backend, resume interrupted jobs and start maintenance."""
+    global _background_started
+    if _background_started: return
+    with _background_lock:
+        if _background_started: return
+        _background_started = True
+    if VERTEX_PREWARM and IMAGE_BACKEND == "vertex":
+        threading.Thread(target=warm_image_model, name="vertex-prewarm", daemon=True).start()
+    resume_render_jobs()
+    start_maintenance_thread()
+
+@bp.before_app_request
 def before_request():
-    init_fs_once()
-    init_db_once()
+    start_background_once()
+
+@bp.cli.command("init-db")
+def init_db_command():
+    """Create directories and tables and apply schema migrations."""
+    init_storage()
+    click.echo(f"Initialized {DB_PATH}")
 
 def login_required(f):
     @wraps(f)
     def wrap(*args, **kwargs):
         if "user_id" not in session:
             flash("Please log in to perform this action.", "warning")
-            return redirect(url_for("login", next=request.path))
+            return redirect(url_for("main.login", next=request.path))
         return f(*args, **kwargs)
     return wrap
 
 def current_user():
-    if "user_id" in session:
-        conn = get_db()
+    """Load the logged-in user at most once per request."""
+    user_id = session.get("user_id")
+    if user_id is None: return None
+    if g.get("user_cache_id") != user_id:
+        cur = get_db().cursor()
+        cur.execute("SELECT * FROM users WHERE id = ?", (user_id,))
+        g.user, g.user_cache_id = cur.fetchone(), user_id
+    return g.user
+
+# ---------- Guest Sessions ----------
+# A guest's cookie carries only an opaque token. Their renderings point at
+# the matching guest_sessions row, which expires GUEST_SESSION_TTL_DAYS after
+# the last visit and is handed over to the account on register/login.
+
+def _guest_expiry() -> str:
+    return (datetime.utcnow() + timedelta(days=GUEST_SESSION_TTL_DAYS)).isoformat()
+
+def guest_token(create: bool = False):
+    """Return the live guest session token for this browser, optionally starting one."""
+    if g.get("guest_token") or ("guest_token" in g and not create):
+        return g.guest_token
+    token = session.get("guest_token")
+    conn = get_db()
+    now = datetime.utcnow()
+    if token:
         cur = conn.cursor()
-        cur.execute("SELECT * FROM users WHERE id = ?", (session["user_id"],))
+        cur.execute("SELECT last_seen_at, expires_at FROM guest_sessions WHERE token = ?", (token,))
         row = cur.fetchone()
-        conn.close()
-        return row
-    return None
+        if not row or row["expires_at"] <= now.isoformat():
+            token = None
+            session.pop("guest_token", None)
+        elif row["last_seen_at"] < (now - timedelta(hours=1)).isoformat():
+            # Slide the expiry forward, but write at most once an hour per guest.
+            conn.execute("UPDATE guest_sessions SET last_seen_at = ?, expires_at = ? WHERE token = ?", (now.isoformat(), _guest_expiry(), token))
+            conn.commit()
+    if not token and (create or session.get("guest_rendering_ids")):
+        token = uuid.uuid4().hex
+        conn.execute("INSERT INTO guest_sessions (token, created_at, last_seen_at, expires_at) VALUES (?, ?, ?, ?)",
+                     (token, now.isoformat(), now.isoformat(), _guest_expiry()))
+        conn.commit()
+        session["guest_token"] = token
+    if token:
+        _adopt_legacy_guest_ids(token)
+    g.guest_token = token
+    return token
+
+def _adopt_legacy_guest_ids(token: str):
+    """Move renderings listed in an old-style cookie onto the guest session."""
+    legacy_ids = session.pop("guest_rendering_ids", None)
+    session.pop("guest_job_ids", None)
+    if not legacy_ids: return
+    conn = get_db()
+    adopted = 0
+    for i in range(0, len(legacy_ids), 500):
+        chunk = legacy_ids[i:i + 500]
+        adopted += conn.execute(f"UPDATE renderings SET guest_token = ? WHERE id IN ({','.join('?' for _ in chunk)}) AND user_id IS NULL AND guest_token IS NULL",
+                                (token, *chunk)).rowcount
+    conn.commit()
+    if adopted:
+        # The hash index has these tagged ownerless; only a rebuild picks up the new owner.
+        hash_index.invalidate()
+
+def render_owner():
+    """(user_id, guest_token) that new renders should belong to."""
+    user_id = session.get("user_id")
+    return (user_id, None) if user_id else (None, guest_token(create=True))
+
+def claim_guest_renderings(user_id: int):
+    """Hand the guest's renderings and in-flight jobs to the account they just signed into."""
+    # Going through guest_token() adopts any old-style cookie ids first, so they're claimed too.
+    token = guest_token()
+    if not token: return
+    conn = get_db()
+    conn.execute("UPDATE renderings SET user_id = ?, guest_token = NULL WHERE guest_token = ? AND user_id IS NULL", (user_id, token))
+    conn.execute("UPDATE render_jobs SET user_id = ?, guest_token = NULL WHERE guest_token = ? AND user_id IS NULL", (user_id, token))
+    conn.execute("DELETE FROM guest_sessions WHERE token = ?", (token,))
+    conn.commit()
+    hash_index.reassign_guest(token, user_id)
+
+@bp.app_context_processor
+def inject_guest_session():
+    count = 0
+    if "user_id" not in session and (session.get("guest_token") or session.get("guest_rendering_ids")):
+        token = guest_token()
+        if token:
+            cur = get_db().cursor()
+            cur.execute("SELECT COUNT(*) FROM renderings WHERE guest_token = ? AND deleted_at IS NULL", (token,))
+            count = cur.fetchone()[0]
+    return {"guest_rendering_count": count}
 
 # ---------- Domain: Options & Prompting ----------
 OPTIONS = {
@@ -137,7 +642,9 @@ def build_room_list(description: str):
         rooms.extend(BASEMENT_ROOMS)
     return rooms
 
-def build_prompt(subcategory: str, master_prompt: str, options_map: dict = None, environment_context: str = None):
+@lru_cache(maxsize=256)
+def compile_prompt(subcategory: str, master_prompt: str, environment_context: str = None):
+    """The option-independent part of a prompt and its negative prompt, built once per room and style."""
     subject = f"A vibrant, inviting, and warm architectural photograph of a residential {subcategory}."
     quality_and_style = f"{master_prompt} The mood is peaceful and aspirational. The space must be depicted in pristine, brand-new construction condition. All surfaces must be immaculately clean. All architectural lines must be straight and true. The lighting is beautiful golden hour light, creating long, gentle shadows. The composition must be balanced and aesthetically pleasing."
     
@@ -158,264 +665,2076 @@ def build_prompt(subcategory: str, master_prompt: str, options_map: dict = None,
         if environment_context:
             view_context += f" The view through any windows MUST look out onto the established environment: {environment_context}."
     
-    selections = ""
-    if options_map:
-        selections = ", ".join([f"{k} is {v}" for k, v in options_map.items() if v and v not in ["None", ""]])
-        selections = f" Specific features to include: {selections}."
+    return f"{subject} {quality_and_style} {view_context}", ", ".join(negative_prompt_parts)
 
-    full_prompt = f"{subject} {quality_and_style} {view_context}{selections}"
-    negative_prompt = ", ".join(negative_prompt_parts)
-    
-    return full_prompt, negative_prompt
+def option_selections(options_map: dict = None) -> str:
+    if not options_map: return ""
+    selections = ", ".join([f"{k} is {v}" for k, v in options_map.items() if v and v not in ["None", ""]])
+    return f" Specific features to include: {selections}."
+
+def build_prompt(subcategory: str, master_prompt: str, options_map: dict = None, environment_context: str = None):
+    base, negative_prompt = compile_prompt(subcategory, master_prompt, environment_context)
+    return base + option_selections(options_map), negative_prompt
+
+def room_master_prompt(description: str) -> str:
+    return f"The interior design style is: {description or 'a tasteful contemporary design'}."
+
+# ---------- Render Storage ----------
+# Renders live at static/renderings/<ab>/<cd>/<uuid>.png, sharded on the uuid
+# so no directory grows past a few files. Every write goes to a temp file in
+# the target directory and is fsynced before it is renamed into place, so
+# neither readers nor a row committed after save() returns can ever see a
+# partial PNG. With write-behind on, only the optional lossless PNG
+# recompression is deferred to a background thread; it rewrites the file the
+# same atomic way.
+
+RECOMPRESS_SAVED = Counter("architect_render_store_recompress_saved_bytes_total", "Bytes saved by lossless PNG recompression.")
+
+def _fsync_dir(path: Path):
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+def recompress_png(data: bytes) -> bytes:
+    """Re-encode a PNG at maximum zlib effort, keeping pixels, text chunks and ICC profile."""
+    with PILImage.open(BytesIO(data)) as img:
+        if img.format != "PNG": return data
+        info = PngImagePlugin.PngInfo()
+        for key, value in getattr(img, "text", {}).items():
+            info.add_text(key, value)
+        buf = BytesIO()
+        img.save(buf, format="PNG", optimize=True, pnginfo=info, icc_profile=img.info.get("icc_profile"))
+    packed = buf.getvalue()
+    return packed if len(packed) < len(data) else data
+
+class RenderStore:
+    def __init__(self, fsync: bool = RENDER_STORE_FSYNC, write_behind: bool = RENDER_STORE_WRITE_BEHIND,
+                 recompress: bool = RENDER_RECOMPRESS):
+        self.fsync, self.write_behind, self.recompress = fsync, write_behind, recompress
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def relative_path(file_name: str) -> str:
+        stem = Path(file_name).stem
+        return (RENDER_DIR / stem[:2] / stem[2:4] / file_name).relative_to(STATIC_DIR).as_posix()
+
+    def sharded_path_for(self, image_path: str):
+        """The sharded location for an existing image_path, or None if it is already there."""
+        file_name = Path(image_path).name
+        if len(Path(file_name).stem) < 4: return None
+        target = self.relative_path(file_name)
+        return None if target == image_path else target
+
+    def write_atomic(self, path: Path, data: bytes, fsync: bool):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+                if fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+        if fsync: _fsync_dir(path.parent)
+
+    def save(self, data: bytes, suffix: str = ".png") -> str:
+        """Store image bytes under a new uuid name; returns the path relative to static/."""
+        rel_path = self.relative_path(f"{uuid.uuid4().hex}{suffix}")
+        path = STATIC_DIR / rel_path
+        if self.write_behind:
+            self.write_atomic(path, data, fsync=self.fsync)
+            if self.recompress:
+                self._enqueue(path)
+        else:
+            packed = recompress_png(data) if self.recompress else data
+            RECOMPRESS_SAVED.inc(len(data) - len(packed))
+            self.write_atomic(path, packed, fsync=self.fsync)
+        IMAGE_BYTES.inc(len(data), kind="rendering")
+        return rel_path
+
+    def _enqueue(self, path: Path):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._drain, name="render-store", daemon=True)
+                    self._thread.start()
+        self._queue.put(path)
+
+    def _drain(self):
+        while True:
+            path = self._queue.get()
+            try:
+                self._settle(path)
+            except FileNotFoundError:
+                pass  # reaped before we got to it
+            except Exception:
+                logger.exception("Deferred recompression failed for %s", path)
+            finally:
+                self._queue.task_done()
+
+    def _settle(self, path: Path):
+        data = path.read_bytes()
+        packed = recompress_png(data)
+        if len(packed) < len(data):
+            self.write_atomic(path, packed, fsync=self.fsync)
+            RECOMPRESS_SAVED.inc(len(data) - len(packed))
+
+    def pending(self) -> int:
+        return self._queue.unfinished_tasks
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """Wait for queued recompression; returns False on timeout."""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if time.monotonic() >= deadline: return False
+            time.sleep(0.02)
+        return True
+
+render_store = RenderStore()
+atexit.register(render_store.flush)
+Gauge("architect_render_store_write_behind_depth", "Renders waiting for recompression.", render_store.pending)
 
 def save_image_bytes(png_bytes: bytes) -> str:
-    uid = uuid.uuid4().hex
-    filepath = RENDER_DIR / f"{uid}.png"
-    with open(filepath, "wb") as f: f.write(png_bytes)
-    return f"renderings/{filepath.name}"
+    return render_store.save(png_bytes)
+
+def _migration_marker() -> Path:
+    """Present (and recently touched) while migrate_render_storage runs, possibly in another process."""
+    return DB_PATH.with_name(f"{DB_PATH.name}.storage-migration")
+
+def migrate_render_storage(dry_run: bool = False, recompress: bool = False) -> dict:
+    """Move flat renderings/<uuid>.png files (and their derivatives) to the sharded layout.
+    Each file is copied, its rows are updated and committed, and only then is the old copy
+    removed, so every row always points at a file and an interrupted run can simply be
+    started again."""
+    conn = get_db()
+    cur = conn.cursor()
+    stats = {"paths": 0, "rows": 0, "missing": 0, "bytes_saved": 0}
+    marker = _migration_marker()
+    if not dry_run: marker.touch()
+    try:
+        cur.execute("SELECT DISTINCT image_path FROM renderings")
+        for old_path in [row[0] for row in cur.fetchall()]:
+            new_path = render_store.sharded_path_for(old_path)
+            if new_path is None: continue
+            src, dst = STATIC_DIR / old_path, STATIC_DIR / new_path
+            if not src.exists() and not dst.exists():
+                stats["missing"] += 1
+                continue
+            stats["paths"] += 1
+            if dry_run: continue
+            marker.touch()
+            copied = []
+            if src.exists():
+                data = src.read_bytes()
+                packed = recompress_png(data) if recompress else data
+                stats["bytes_saved"] += len(data) - len(packed)
+                render_store.write_atomic(dst, packed, fsync=True)
+                copied.append(src)
+                for width in RESPONSIVE_WIDTHS:
+                    derived_src = derived_path(old_path, width)
+                    if derived_src.exists():
+                        render_store.write_atomic(derived_path(new_path, width), derived_src.read_bytes(), fsync=False)
+                        copied.append(derived_src)
+            cur.execute("UPDATE renderings SET image_path = ? WHERE image_path = ?", (new_path, old_path))
+            stats["rows"] += cur.rowcount
+            conn.commit()
+            for path in copied:
+                path.unlink(missing_ok=True)
+    finally:
+        if not dry_run: marker.unlink(missing_ok=True)
+    return stats
+
+@bp.cli.command("migrate-storage")
+@click.option("--dry-run", is_flag=True, help="Count what would move without touching anything.")
+@click.option("--recompress", is_flag=True, help="Losslessly recompress each PNG as it moves.")
+def migrate_storage_command(dry_run, recompress):
+    """Move flat render files into the sharded layout and update image_path."""
+    click.echo(json.dumps(migrate_render_storage(dry_run=dry_run, recompress=recompress), indent=2))
+
+# ---------- Image Derivatives ----------
+# Gallery cards and slides load a resized WebP/JPEG instead of the full PNG.
+# Derivatives are built on first request and, like the uuid-named originals
+# they come from, never change, so browsers may cache them forever.
+
+def derived_url(image_path: str, width: int) -> str:
+    return url_for('main.derived_image', width=width, image_path=image_path)
+
+@bp.app_template_global()
+def image_srcset(image_path: str) -> str:
+    return ", ".join(f"{derived_url(image_path, w)} {w}w" for w in RESPONSIVE_WIDTHS)
+
+@bp.app_context_processor
+def inject_responsive_widths():
+    return {"responsive_widths": RESPONSIVE_WIDTHS}
+
+def derived_path(image_path: str, width: int) -> Path:
+    return DERIVED_DIR / str(width) / Path(image_path).with_suffix("." + DERIVED_FORMAT.lower())
 
-def generate_image_via_google_ai(prompt: str, negative_prompt: str, base_image: GoogleAIImage = None) -> str:
+def build_derivative(source: Path, width: int, target: Path):
+    with PILImage.open(source) as img:
+        img = img.convert("RGB")
+        if img.width > width:
+            img = img.resize((width, round(img.height * width / img.width)), PILImage.LANCZOS)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = target.with_name(f".{target.name}.{uuid.uuid4().hex}.tmp")
+        extra = {"method": 4} if DERIVED_FORMAT == "WEBP" else {"optimize": True, "progressive": True}
+        img.save(tmp_path, format=DERIVED_FORMAT, quality=DERIVED_QUALITY, **extra)
+        IMAGE_BYTES.inc(tmp_path.stat().st_size, kind="derived")
+        os.replace(tmp_path, target)
+
+@bp.get("/derived/<int:width>/<path:image_path>")
+def derived_image(width, image_path):
+    if width not in RESPONSIVE_WIDTHS: abort(404)
+    source = (STATIC_DIR / image_path).resolve()
+    if not source.is_relative_to(RENDER_DIR.resolve()) or not source.is_file(): abort(404)
+    target = derived_path(image_path, width)
+    if not target.exists():
+        build_derivative(source, width, target)
+    response = send_file(target, mimetype=DERIVED_MIMETYPE, max_age=31536000, conditional=True, etag=True)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+# ---------- Vertex Model Registry ----------
+# vertexai.init() and from_pretrained() cost an auth round trip and a model
+# lookup, so they run once per process and the model object is shared by all
+# render threads.
+_vertex_initialized = False
+_image_models = {}
+_vertex_lock = threading.Lock()
+
+def get_image_model(version: str = None):
+    version = version or IMAGE_MODEL_VERSION
+    model = _image_models.get(version)
+    if model is not None: return model
+    global _vertex_initialized
+    with _vertex_lock:
+        if version not in _image_models:
+            # The SDK takes seconds to import, so only processes that render pay for it.
+            import vertexai
+            from vertexai.vision_models import ImageGenerationModel
+            if not GCP_PROJECT_ID:
+                raise RuntimeError("GCP_PROJECT_ID environment variable not set.")
+            if not _vertex_initialized:
+                vertexai.init(project=GCP_PROJECT_ID, location=GCP_LOCATION)
+                _vertex_initialized = True
+            _image_models[version] = ImageGenerationModel.from_pretrained(version)
+        return _image_models[version]
+
+def warm_image_model():
+    try:
+        started = time.perf_counter()
+        get_image_model()
+        logger.info("Vertex model %s warmed in %.2fs", IMAGE_MODEL_VERSION, time.perf_counter() - started)
+    except Exception as e:
+        logger.warning("Vertex model warm-up failed: %s", e)
+
+@bp.cli.command("bench-model-init")
+@click.option("--runs", default=5, show_default=True, help="Number of timed acquisitions per mode.")
+def bench_model_init(runs):
+    """Compare per-render model setup: fresh init per call vs. the warm registry."""
     if not GCP_PROJECT_ID:
-        raise RuntimeError("GCP_PROJECT_ID environment variable not set.")
-    vertexai.init(project=GCP_PROJECT_ID, location=GCP_LOCATION)
-    model = ImageGenerationModel.from_pretrained("imagegeneration@006")
-    if base_image:
-        response = model.edit_image(prompt=prompt, base_image=base_image, negative_prompt=negative_prompt)
-    else:
-        response = model.generate_images(prompt=prompt, number_of_images=1, aspect_ratio="16:9", negative_prompt=negative_prompt)
-    if not response:
-        raise RuntimeError("Google AI did not return any images.")
-    image_bytes = response[0]._image_bytes
+        raise click.ClickException("GCP_PROJECT_ID environment variable not set.")
+    import vertexai
+    from vertexai.vision_models import ImageGenerationModel
+    cold = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        vertexai.init(project=GCP_PROJECT_ID, location=GCP_LOCATION)
+        ImageGenerationModel.from_pretrained(IMAGE_MODEL_VERSION)
+        cold.append(time.perf_counter() - started)
+    get_image_model()
+    warm = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        get_image_model()
+        warm.append(time.perf_counter() - started)
+    click.echo(f"per-call init:  mean {sum(cold) / runs * 1000:.1f} ms  max {max(cold) * 1000:.1f} ms")
+    click.echo(f"warm registry:  mean {sum(warm) / runs * 1000:.3f} ms  max {max(warm) * 1000:.3f} ms")
+
+# ---------- Image Backends ----------
+# Every render goes through one backend object. VertexBackend is production;
+# FakeBackend draws a deterministic placeholder with configurable latency and
+# failure rate so the queue, cache and gallery can be load-tested offline.
+class ImageBackendError(RuntimeError):
+    def __init__(self, message: str, retryable: bool = False):
+        super().__init__(message)
+        self.retryable = retryable
+
+class ImageBackend:
+    """Turns a prompt into PNG bytes."""
+    name = "base"
+
+    @property
+    def model_id(self) -> str:
+        return self.name
+
+    def warm(self):
+        pass
+
+    def generate(self, prompt: str, negative_prompt: str, aspect_ratio: str = RENDER_ASPECT_RATIO, base_image=None) -> bytes:
+        raise NotImplementedError
+
+class VertexBackend(ImageBackend):
+    name = "vertex"
+
+    def __init__(self, model_version: str = None):
+        self.model_version = model_version or IMAGE_MODEL_VERSION
+
+    @property
+    def model_id(self) -> str:
+        return self.model_version
+
+    def warm(self):
+        warm_image_model()
+
+    def generate(self, prompt, negative_prompt, aspect_ratio=RENDER_ASPECT_RATIO, base_image=None):
+        model = get_image_model(self.model_version)
+        if base_image is not None:
+            response = model.edit_image(prompt=prompt, base_image=base_image, negative_prompt=negative_prompt)
+        else:
+            response = model.generate_images(prompt=prompt, number_of_images=1, aspect_ratio=aspect_ratio, negative_prompt=negative_prompt)
+        if not response:
+            raise ImageBackendError("Google AI did not return any images.")
+        return response[0]._image_bytes
+
+class FakeBackend(ImageBackend):
+    """Same prompt, same picture; latency and failures are drawn from a seeded RNG."""
+    name = "fake"
+
+    def __init__(self, latency_ms: int = 0, jitter_ms: int = 0, failure_rate: float = 0.0, seed=None, width: int = 1024):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.failure_rate = failure_rate
+        self.width = width
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+
+    def _size(self, aspect_ratio: str):
+        w, _, h = (aspect_ratio or "1:1").partition(":")
+        try:
+            return self.width, max(1, round(self.width * int(h) / int(w)))
+        except (ValueError, ZeroDivisionError):
+            return self.width, self.width
+
+    def generate(self, prompt, negative_prompt, aspect_ratio=RENDER_ASPECT_RATIO, base_image=None):
+        with self._rng_lock:
+            delay = max(0, self.latency_ms + self._rng.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+            fail = self._rng.random() < self.failure_rate
+        time.sleep(delay)
+        if fail:
+            raise ImageBackendError("Fake backend failure (simulated).", retryable=True)
+        seed = hashlib.sha256(json.dumps([prompt, negative_prompt, aspect_ratio]).encode()).digest()
+        rng = random.Random(seed)
+        width, height = self._size(aspect_ratio)
+        img = PILImage.new("RGB", (width, height), tuple(seed[:3]))
+        d = ImageDraw.Draw(img)
+        for _ in range(12):
+            x0, y0 = rng.randrange(width), rng.randrange(height)
+            x1, y1 = x0 + rng.randrange(width // 8, width // 2), y0 + rng.randrange(height // 8, height // 2)
+            d.rectangle([x0, y0, x1, y1], fill=tuple(rng.randrange(256) for _ in range(3)))
+        d.text((16, 16), prompt[:120], fill="#fff")
+        buf = BytesIO()
+        img.save(buf, format="PNG")
+        return buf.getvalue()
+
+_image_backend = None
+_image_backend_lock = threading.Lock()
+
+def build_image_backend(kind: str = None) -> ImageBackend:
+    kind = (kind or IMAGE_BACKEND).lower()
+    if kind == "vertex":
+        return VertexBackend()
+    if kind == "fake":
+        return FakeBackend(FAKE_BACKEND_LATENCY_MS, FAKE_BACKEND_JITTER_MS, FAKE_BACKEND_FAILURE_RATE, FAKE_BACKEND_SEED)
+    raise ValueError(f"Unknown IMAGE_BACKEND {kind!r} (expected 'vertex' or 'fake').")
+
+def get_image_backend() -> ImageBackend:
+    global _image_backend
+    if _image_backend is None:
+        with _image_backend_lock:
+            if _image_backend is None:
+                _image_backend = build_image_backend()
+    return _image_backend
+
+def set_image_backend(backend: ImageBackend):
+    """Swap the process-wide backend (benchmarks and local runs)."""
+    global _image_backend
+    with _image_backend_lock:
+        _image_backend = backend
+
+def generate_image(prompt: str, negative_prompt: str, base_image=None, use_cache: bool = True, subcategory: str = "",
+                   charge_on_miss: str = None) -> str:
+    """Render through the active backend (or the render cache) and save the PNG; returns its path under static/.
+    charge_on_miss is the rate-limit key of a render admitted for free as a cache hit, charged if the entry is gone."""
+    backend = get_image_backend()
+    cache_key = None
+    if RENDER_CACHE_ENABLED and use_cache and base_image is None:
+        cache_key = render_cache_key(prompt, negative_prompt, model=backend.model_id)
+        cached = render_cache_lookup(cache_key)
+        if cached is not None:
+            return save_image_bytes(cached)
+    if charge_on_miss:
+        render_limiter.admit(charge_on_miss)
+    image_bytes = call_backend(backend, prompt, negative_prompt, base_image, subcategory)
+    if cache_key:
+        render_cache_store(cache_key, image_bytes)
     return save_image_bytes(image_bytes)
 
+# ---------- Backend Resilience ----------
+# Renders are admitted only while the caller's and the process's token
+# buckets have room (one token per image), so a flood of clicks gets a 429
+# instead of a queue full of doomed jobs. Backend calls that fail with a
+# throttling or transient upstream error are retried with full-jitter
+# exponential backoff. Consecutive transient failures open a circuit breaker:
+# new renders are refused with a 503 and in-flight specs fail fast until a
+# single trial call after BREAKER_RESET_SECONDS succeeds.
+
+class RenderRejected(RuntimeError):
+    status = 503
+
+    def __init__(self, message: str, retry_after: float = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class RenderQueueFull(RenderRejected):
+    pass
+
+class RateLimited(RenderRejected):
+    status = 429
+
+class BackendUnavailable(RenderRejected):
+    pass
+
+ADMISSION_REJECTIONS = Counter("architect_admission_rejections_total", "Render requests refused before queueing, by reason.")
+BACKEND_RETRIES = Counter("architect_image_backend_retries_total", "Backend calls retried after a transient error.")
+BREAKER_TRANSITIONS = Counter("architect_circuit_breaker_transitions_total", "Circuit breaker state changes by new state.")
+
+class TokenBucket:
+    """`rate` tokens per second up to `burst`, refilled lazily."""
+    def __init__(self, rate: float, burst: int, now: float = None):
+        self.rate, self.burst = rate, burst
+        self.tokens, self.updated = float(burst), time.monotonic() if now is None else now
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, n: int, now: float) -> float:
+        """Take n tokens and return 0, or return the seconds until n would be available."""
+        self._refill(now)
+        if self.tokens >= n:
+            self.tokens -= n
+            return 0.0
+        if n > self.burst or self.rate <= 0: return float("inf")
+        return (n - self.tokens) / self.rate
+
+    def give(self, n: int):
+        self.tokens = min(self.burst, self.tokens + n)
+
+class RateLimiter:
+    def __init__(self, user_per_minute: float, user_burst: int, global_per_minute: float, global_burst: int,
+                 clock=time.monotonic):
+        self.user_rate, self.user_burst = user_per_minute / 60, user_burst
+        self.clock = clock
+        self.global_bucket = TokenBucket(global_per_minute / 60, global_burst, clock())
+        self.buckets = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, key: str, now: float) -> TokenBucket:
+        if len(self.buckets) > 10000:
+            for k in [k for k, b in self.buckets.items() if (now - b.updated) * b.rate >= b.burst]:
+                del self.buckets[k]
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = TokenBucket(self.user_rate, self.user_burst, now)
+        return bucket
+
+    def admit(self, key: str, n: int = 1):
+        """Charge n renders to `key` and to the process, or raise RateLimited."""
+        now = self.clock()
+        with self._lock:
+            bucket = self._bucket(key, now)
+            wait = bucket.take(n, now)
+            if wait:
+                ADMISSION_REJECTIONS.inc(reason="user_rate")
+                raise RateLimited(self._message(n, wait, bucket.burst, "You are rendering faster than we can keep up with."), _retry_seconds(wait))
+            wait = self.global_bucket.take(n, now)
+            if wait:
+                bucket.give(n)
+                ADMISSION_REJECTIONS.inc(reason="global_rate")
+                raise RateLimited(self._message(n, wait, self.global_bucket.burst, "The render service is busy."), _retry_seconds(wait))
+
+    def admit_up_to(self, key: str, n: int) -> int:
+        """Charge as many of n renders as both buckets hold right now; raises RateLimited only if none fit."""
+        now = self.clock()
+        with self._lock:
+            bucket = self._bucket(key, now)
+            bucket._refill(now)
+            self.global_bucket._refill(now)
+            admitted = min(n, int(bucket.tokens), int(self.global_bucket.tokens))
+            if admitted > 0:
+                bucket.tokens -= admitted
+                self.global_bucket.tokens -= admitted
+                return admitted
+        self.admit(key, 1)
+        return 1
+
+    @staticmethod
+    def _message(n, wait, burst, reason):
+        if wait == float("inf"):
+            return f"{reason} This request needs {n} renders but at most {burst} can be started at once."
+        seconds = _retry_seconds(wait)
+        return f"{reason} Please try again in {seconds} second{'s' if seconds != 1 else ''}."
+
+def _retry_seconds(wait: float) -> int:
+    return 3600 if wait == float("inf") else max(1, int(wait + 0.999))
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int, reset_seconds: float, clock=time.monotonic):
+        self.failure_threshold, self.reset_seconds = failure_threshold, reset_seconds
+        self.clock = clock
+        self.state, self.failures, self.opened_at = "closed", 0, 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def _set_state(self, state: str):
+        if state != self.state:
+            self.state = state
+            BREAKER_TRANSITIONS.inc(state=state)
+            logger.warning("Image backend circuit breaker is now %s", state)
+
+    def retry_after(self):
+        """Seconds until the breaker will let a new call through, or None if it would now."""
+        with self._lock:
+            if self.state == "open":
+                remaining = self.opened_at + self.reset_seconds - self.clock()
+                return remaining if remaining > 0 else None
+            return 1.0 if self.state == "half_open" and self._trial_in_flight else None
+
+    def before_call(self):
+        with self._lock:
+            if self.state == "open":
+                remaining = self.opened_at + self.reset_seconds - self.clock()
+                if remaining > 0:
+                    raise BackendUnavailable("The image service is unavailable right now. Please try again shortly.", remaining)
+                self._set_state("half_open")
+                self._trial_in_flight = False
+            if self.state == "half_open":
+                if self._trial_in_flight:
+                    raise BackendUnavailable("The image service is recovering. Please try again shortly.", 1.0)
+                self._trial_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._trial_in_flight = False
+            self._set_state("closed")
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.opened_at = self.clock()
+                self._set_state("open")
+
+render_limiter = RateLimiter(RATE_LIMIT_USER_PER_MINUTE, RATE_LIMIT_USER_BURST, RATE_LIMIT_GLOBAL_PER_MINUTE, RATE_LIMIT_GLOBAL_BURST)
+backend_breaker = CircuitBreaker(BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_SECONDS)
+Gauge("architect_circuit_breaker_open", "1 while the image backend circuit breaker is open or half-open.",
+      lambda: int(backend_breaker.state != "closed"))
+
+# google.api_core exception class names for throttling and transient upstream
+# failures; matched by name so the check doesn't import the SDK.
+RETRYABLE_ERROR_NAMES = {"ResourceExhausted", "TooManyRequests", "ServiceUnavailable", "DeadlineExceeded",
+                         "InternalServerError", "BadGateway", "GatewayTimeout", "Aborted"}
+
+def is_retryable(exc: Exception) -> bool:
+    if isinstance(exc, BackendUnavailable): return False
+    if isinstance(exc, ImageBackendError): return exc.retryable
+    if isinstance(exc, (ConnectionError, TimeoutError)): return True
+    if any(cls.__name__ in RETRYABLE_ERROR_NAMES for cls in type(exc).__mro__): return True
+    return getattr(exc, "code", None) in (429, 500, 502, 503, 504)
+
+# Caps concurrent model calls across every render worker and fan-out thread in
+# the process; retries give the slot back while they sleep.
+_backend_slots = threading.BoundedSemaphore(RENDER_FANOUT_LIMIT)
+
+def backoff_delay(attempt: int) -> float:
+    return random.uniform(0, min(BACKEND_RETRY_MAX_SECONDS, BACKEND_RETRY_BASE_SECONDS * 2 ** attempt))
+
+def _subcategory_label(subcategory: str) -> str:
+    """Metric label for a subcategory; anything outside the catalog shares one series."""
+    return subcategory if subcategory in OPTIONS else "other"
+
+def call_backend(backend: ImageBackend, prompt: str, negative_prompt: str, base_image=None, subcategory: str = "") -> bytes:
+    """One backend render behind the circuit breaker, retrying transient failures."""
+    attempt = 0
+    label = _subcategory_label(subcategory)
+    while True:
+        backend_breaker.before_call()
+        started = time.perf_counter()
+        try:
+            with _backend_slots:
+                image_bytes = backend.generate(prompt, negative_prompt, RENDER_ASPECT_RATIO, base_image=base_image)
+        except Exception as e:
+            BACKEND_LATENCY.observe(time.perf_counter() - started, backend=backend.name, subcategory=label, outcome="error")
+            BACKEND_ERRORS.inc(backend=backend.name, subcategory=label)
+            if not is_retryable(e):
+                backend_breaker.record_success()  # the upstream answered; the request itself was bad
+                raise
+            backend_breaker.record_failure()
+            if attempt >= BACKEND_MAX_RETRIES: raise
+            delay = backoff_delay(attempt)
+            attempt += 1
+            BACKEND_RETRIES.inc(backend=backend.name)
+            logger.info("Retrying %s render in %.1fs (attempt %d): %s", subcategory or "image", delay, attempt, e)
+            time.sleep(delay)
+            continue
+        elapsed = time.perf_counter() - started
+        backend_breaker.record_success()
+        BACKEND_LATENCY.observe(elapsed, backend=backend.name, subcategory=label, outcome="ok")
+        logger.info("Rendered %s with %s in %.2fs", subcategory or "image", backend.model_id, elapsed)
+        return image_bytes
+
+# ---------- Render Cache ----------
+# build_prompt is deterministic, so identical (model, prompt, negative prompt,
+# aspect ratio) requests can reuse an earlier image. The cache keeps its own
+# copy outside static/ so deleting a rendering never breaks a cache entry; a
+# hit is copied into a fresh renderings file. Entries are evicted LRU once
+# the cache grows past RENDER_CACHE_MAX_MB.
+
+RENDER_CACHE_EVENTS = Counter("architect_render_cache_events_total", "Render cache lookups and writes by event (hit, miss, store, eviction).")
+
+def render_cache_key(prompt: str, negative_prompt: str, aspect_ratio: str = RENDER_ASPECT_RATIO, model: str = None) -> str:
+    payload = json.dumps([model or IMAGE_MODEL_VERSION, prompt, negative_prompt, aspect_ratio])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def render_cache_lookup(key: str):
+    conn = get_db()
+    cur = conn.cursor()
+    cur.execute("SELECT file_name FROM render_cache WHERE key = ?", (key,))
+    row = cur.fetchone()
+    image_bytes = None
+    if row:
+        try:
+            image_bytes = (RENDER_CACHE_DIR / row["file_name"]).read_bytes()
+        except FileNotFoundError:
+            cur.execute("DELETE FROM render_cache WHERE key = ?", (key,))
+        else:
+            cur.execute("UPDATE render_cache SET hits = hits + 1, last_used_at = ? WHERE key = ?", (datetime.utcnow().isoformat(), key))
+        conn.commit()
+    RENDER_CACHE_EVENTS.inc(event="hit" if image_bytes is not None else "miss")
+    return image_bytes
+
+def render_cache_store(key: str, image_bytes: bytes):
+    file_name = f"{key}.png"
+    tmp_path = RENDER_CACHE_DIR / f".{file_name}.{uuid.uuid4().hex}.tmp"
+    tmp_path.write_bytes(image_bytes)
+    IMAGE_BYTES.inc(len(image_bytes), kind="cache")
+    os.replace(tmp_path, RENDER_CACHE_DIR / file_name)
+    now = datetime.utcnow().isoformat()
+    conn = get_db()
+    conn.execute("INSERT OR REPLACE INTO render_cache (key, file_name, size_bytes, hits, created_at, last_used_at) VALUES (?, ?, ?, 0, ?, ?)",
+                 (key, file_name, len(image_bytes), now, now))
+    conn.commit()
+    RENDER_CACHE_EVENTS.inc(event="store")
+    evict_render_cache()
+
+def evict_render_cache(max_bytes: int = None):
+    """Drop least-recently-used entries until the cache fits in max_bytes."""
+    max_bytes = RENDER_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    conn = get_db()
+    cur = conn.cursor()
+    cur.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM render_cache")
+    excess = cur.fetchone()[0] - max_bytes
+    evicted = []
+    if excess > 0:
+        cur.execute("SELECT key, file_name, size_bytes FROM render_cache ORDER BY last_used_at")
+        for row in cur.fetchall():
+            if excess <= 0: break
+            evicted.append(row["key"])
+            excess -= row["size_bytes"]
+            (RENDER_CACHE_DIR / row["file_name"]).unlink(missing_ok=True)
+        cur.executemany("DELETE FROM render_cache WHERE key = ?", [(k,) for k in evicted])
+        conn.commit()
+    if evicted:
+        RENDER_CACHE_EVENTS.inc(len(evicted), event="eviction")
+
+def render_cache_stats() -> dict:
+    conn = get_db()
+    cur = conn.cursor()
+    cur.execute("SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM render_cache")
+    entries, size_bytes = cur.fetchone()
+    stats = {"hits": RENDER_CACHE_EVENTS.value(event="hit"), "misses": RENDER_CACHE_EVENTS.value(event="miss"),
+             "stores": RENDER_CACHE_EVENTS.value(event="store"), "evictions": RENDER_CACHE_EVENTS.value(event="eviction")}
+    lookups = stats["hits"] + stats["misses"]
+    stats.update({"enabled": RENDER_CACHE_ENABLED, "entries": entries, "size_bytes": size_bytes,
+                  "max_bytes": RENDER_CACHE_MAX_BYTES, "hit_rate": stats["hits"] / lookups if lookups else 0.0})
+    return stats
+
+# ---------- Render Jobs ----------
+# Renders run on a bounded thread pool so web workers never wait on Vertex.
+# A job is a list of render specs; its `renderings` rows are inserted only
+# once the images exist, and clients follow progress through /jobs/<id>.
+
+_render_pool = None
+_render_pool_lock = threading.Lock()
+_pending_jobs = 0
+
+def get_render_pool():
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is None:
+            _render_pool = ThreadPoolExecutor(max_workers=RENDER_WORKERS, thread_name_prefix="render")
+        return _render_pool
+
+def render_spec(category: str, subcategory: str, options: dict, prompt: str, negative_prompt: str, use_cache: bool = True,
+                description: str = None) -> dict:
+    # render_key is the render cache digest, stored on the rendering so sweeps can spot variants already made.
+    return {"category": category, "subcategory": subcategory, "options": options or {},
+            "prompt": prompt, "negative_prompt": negative_prompt, "use_cache": use_cache,
+            "description": (description or "").strip() or None,
+            "render_key": render_cache_key(prompt, negative_prompt, model=get_image_backend().model_id)}
+
+def _submit_render_job(job_id: str):
+    global _pending_jobs
+    with _render_pool_lock:
+        _pending_jobs += 1
+    get_render_pool().submit(run_render_job, job_id)
+
+def rejected_response(message: str, e: RenderRejected):
+    response = jsonify({"error": message})
+    response.status_code = e.status
+    if e.retry_after:
+        response.headers["Retry-After"] = str(_retry_seconds(e.retry_after))
+    return response
+
+def rate_limit_key(user_id=None, guest_token=None) -> str:
+    return f"user:{user_id}" if user_id else f"guest:{guest_token}"
+
+def admit_renders(n: int, user_id=None, guest_token=None, partial: bool = False) -> int:
+    """Admit a job of n renders and return how many were charged to the rate limit.
+    Raises a RenderRejected subclass when the backend is down, the queue is full or the
+    caller is over their rate limit; with partial=True only when not even one render fits."""
+    retry_after = backend_breaker.retry_after()
+    if retry_after:
+        ADMISSION_REJECTIONS.inc(reason="circuit_open")
+        raise BackendUnavailable("The image service is unavailable right now. Please try again shortly.", retry_after)
+    if _pending_jobs >= RENDER_QUEUE_LIMIT:
+        QUEUE_REJECTIONS.inc()
+        raise RenderQueueFull("The render queue is full. Please try again in a minute.", 60)
+    if n <= 0: return 0
+    key = rate_limit_key(user_id, guest_token)
+    if partial:
+        return render_limiter.admit_up_to(key, n)
+    render_limiter.admit(key, n)
+    return n
+
+def enqueue_render_job(specs: list, user_id=None, guest_token=None) -> str:
+    """Admit, persist and hand a job to the worker pool; returns the job id immediately."""
+    admit_renders(len(specs), user_id, guest_token)
+    return create_render_job(specs, user_id, guest_token)
+
+def create_render_job(specs: list, user_id=None, guest_token=None) -> str:
+    """Persist an already admitted job and hand it to the worker pool."""
+    job_id = uuid.uuid4().hex
+    now = datetime.utcnow().isoformat()
+    conn = get_db()
+    conn.execute("INSERT INTO render_jobs (id, user_id, guest_token, status, specs_json, created_at, updated_at) VALUES (?, ?, ?, 'queued', ?, ?, ?)",
+                 (job_id, user_id, guest_token, json.dumps(specs), now, now))
+    conn.commit()
+    notify_job_change()
+    _submit_render_job(job_id)
+    return job_id
+
+def run_render_job(job_id: str):
+    global _pending_jobs
+    conn = get_db()
+    cur = conn.cursor()
+    try:
+        # Claim atomically so a job resumed by several processes only renders once.
+        now = datetime.utcnow().isoformat()
+        cur.execute("UPDATE render_jobs SET status = 'running', started_at = ?, updated_at = ? WHERE id = ? AND status = 'queued'",
+                    (now, now, job_id))
+        conn.commit()
+        if cur.rowcount == 0: return
+        notify_job_change()
+        cur.execute("SELECT * FROM render_jobs WHERE id = ?", (job_id,))
+        job = cur.fetchone()
+        specs = json.loads(job["specs_json"])
+        rendered = render_specs_concurrently(specs)
+        # Re-read the owner: a guest may have signed in while the job was rendering.
+        cur.execute("SELECT user_id, guest_token FROM render_jobs WHERE id = ?", (job_id,))
+        owner = cur.fetchone()
+        hash_index.refresh()
+        # Every image is on disk before any row is written, so the batch and the job's
+        # final status land in one transaction.
+        rendering_ids, failures, hashed, duplicates = [], [], [], 0
+        for spec, (rel_path, hashes, error) in zip(specs, rendered):
+            if error:
+                failures.append({"subcategory": spec["subcategory"], "error": error})
+                continue
+            duplicate_of = find_duplicate_of(cur, owner["user_id"], owner["guest_token"], hashes, hashed) if hashes else None
+            cur.execute("INSERT INTO renderings (user_id, guest_token, category, subcategory, options_json, prompt, description, image_path, created_at, dhash, phash, duplicate_of, render_key) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (owner["user_id"], owner["guest_token"], spec["category"], spec["subcategory"], json.dumps(spec["options"]), spec["prompt"], spec.get("description"), rel_path, datetime.utcnow().isoformat(),
+                         *(hashes or (None, None)), duplicate_of, spec.get("render_key")))
+            rendering_ids.append(cur.lastrowid)
+            if hashes: hashed.append((cur.lastrowid, hashes))
+            if duplicate_of: duplicates += 1
+        status = "done" if rendering_ids else "failed"
+        error = None if rendering_ids else "; ".join(f["error"] for f in failures) or "No renderings were produced."
+        now = datetime.utcnow().isoformat()
+        cur.execute("UPDATE render_jobs SET status = ?, result_json = ?, error = ?, finished_at = ?, updated_at = ? WHERE id = ?",
+                    (status, json.dumps({"rendering_ids": rendering_ids, "failures": failures}), error, now, now, job_id))
+        conn.commit()
+        RENDER_JOBS.inc(status=status)
+        NEAR_DUPLICATES.inc(duplicates)
+    except Exception as e:
+        logger.exception("Render job %s failed", job_id)
+        conn.rollback()
+        now = datetime.utcnow().isoformat()
+        cur.execute("UPDATE render_jobs SET status = 'failed', error = ?, finished_at = ?, updated_at = ? WHERE id = ?",
+                    (str(e), now, now, job_id))
+        conn.commit()
+        RENDER_JOBS.inc(status="failed")
+    finally:
+        notify_job_change()
+        with _render_pool_lock:
+            _pending_jobs -= 1
+
+def _render_one(spec: dict):
+    try:
+        rel_path = generate_image(spec["prompt"], spec["negative_prompt"], use_cache=spec.get("use_cache", True), subcategory=spec["subcategory"],
+                                  charge_on_miss=spec.get("charge_on_miss"))
+    except Exception as e:
+        logger.warning("Render of %s failed: %s", spec["subcategory"], e)
+        return None, None, str(e)
+    return rel_path, hash_rendering_file(rel_path), None
+
+def render_specs_concurrently(specs: list) -> list:
+    """Render specs in parallel; returns (rel_path, hashes, error) per spec.
+    Model calls are capped process-wide at RENDER_FANOUT_LIMIT by call_backend, not per job."""
+    if len(specs) == 1:
+        return [_render_one(specs[0])]
+    with ThreadPoolExecutor(max_workers=max(1, min(RENDER_FANOUT_LIMIT, len(specs))), thread_name_prefix="render-fanout") as pool:
+        return list(pool.map(_render_one, specs))
+
+def resume_render_jobs():
+    """Re-submit queued jobs left by a previous process and fail ones that died mid-render."""
+    conn = get_db()
+    cur = conn.cursor()
+    cutoff = (datetime.utcnow() - timedelta(seconds=RENDER_JOB_TIMEOUT)).isoformat()
+    now = datetime.utcnow().isoformat()
+    cur.execute("UPDATE render_jobs SET status = 'failed', error = 'Render timed out.', finished_at = ?, updated_at = ? WHERE status = 'running' AND started_at < ?",
+                (now, now, cutoff))
+    conn.commit()
+    cur.execute("SELECT id FROM render_jobs WHERE status = 'queued' ORDER BY created_at")
+    job_ids = [row["id"] for row in cur.fetchall()]
+    for job_id in job_ids:
+        _submit_render_job(job_id)
+
+def get_render_job(job_id: str):
+    conn = get_db()
+    cur = conn.cursor()
+    cur.execute("SELECT * FROM render_jobs WHERE id = ?", (job_id,))
+    job = cur.fetchone()
+    return job
+
+def job_payload(job) -> dict:
+    result = json.loads(job["result_json"] or "{}")
+    rendering_ids = result.get("rendering_ids", [])
+    renderings = []
+    if rendering_ids:
+        conn = get_db()
+        cur = conn.cursor()
+        q_marks = ",".join("?" for _ in rendering_ids)
+        cur.execute(f"SELECT id, subcategory, image_path, duplicate_of FROM renderings WHERE id IN ({q_marks}) AND deleted_at IS NULL", rendering_ids)
+        renderings = [{"id": r["id"], "subcategory": r["subcategory"], "image_path": r["image_path"], "duplicate_of": r["duplicate_of"],
+                       "path": url_for('static', filename=r["image_path"])} for r in cur.fetchall()]
+    return {"id": job["id"], "status": job["status"], "error": job["error"], "renderings": renderings,
+            "failures": result.get("failures", []), "created_at": job["created_at"],
+            "started_at": job["started_at"], "finished_at": job["finished_at"]}
+
+# ---------- Render Progress Stream ----------
+# GET /events/renders is a Server-Sent Events stream of the caller's job
+# transitions (queued, started, completed, failed). Jobs finished by this
+# process wake the stream immediately; jobs finished by other processes are
+# picked up by a cheap indexed poll on render_jobs.updated_at. A stream holds
+# a worker, so it ends as soon as the caller has no queued or running jobs and
+# at the latest after SSE_MAX_SECONDS; pages only open it while they wait on a
+# job and poll /jobs/<id> for whatever is still pending when it ends.
+
+SSE_EVENT_NAMES = {"queued": "queued", "running": "started", "done": "completed", "failed": "failed"}
+_job_changed = threading.Condition()
+
+def notify_job_change():
+    with _job_changed:
+        _job_changed.notify_all()
+
+def _sse(event: str, data: dict, event_id: str = None) -> str:
+    lines = [f"event: {event}"]
+    if event_id: lines.append(f"id: {event_id}")
+    lines.append(f"data: {json.dumps(data)}")
+    return "\n".join(lines) + "\n\n"
+
+@bp.get("/events/renders")
+def render_events():
+    user_id = session.get("user_id")
+    token = None if user_id else guest_token()
+    if not user_id and not token:
+        return Response("retry: 30000\n\n", mimetype="text/event-stream")
+    owner_clause, owner_value = ("user_id = ?", user_id) if user_id else ("guest_token = ?", token)
+    # Unary + keeps the owner's (long) job history out of it: only active jobs are walked, via the status index.
+    active_sql = f"SELECT 1 FROM render_jobs WHERE status IN ('queued', 'running') AND +{owner_clause} LIMIT 1"
+    since = request.headers.get("Last-Event-ID") or (datetime.utcnow() - timedelta(seconds=SSE_BACKLOG_SECONDS)).isoformat()
+
+    def stream():
+        nonlocal since
+        deadline = time.monotonic() + SSE_MAX_SECONDS
+        last_write = time.monotonic()
+        yield "retry: 3000\n\n"
+        while time.monotonic() < deadline:
+            cur = get_db().cursor()
+            # Checked before reading events so a job finishing in between is still reported.
+            active = cur.execute(active_sql, (owner_value,)).fetchone() is not None
+            cur.execute(f"SELECT * FROM render_jobs WHERE {owner_clause} AND updated_at > ? ORDER BY updated_at", (owner_value, since))
+            for job in cur.fetchall():
+                since = job["updated_at"]
+                yield _sse(SSE_EVENT_NAMES.get(job["status"], job["status"]), job_payload(job), since)
+                last_write = time.monotonic()
+            if not active: return
+            if time.monotonic() - last_write >= SSE_HEARTBEAT_SECONDS:
+                yield ": keep-alive\n\n"
+                last_write = time.monotonic()
+            with _job_changed:
+                _job_changed.wait(SSE_POLL_SECONDS)
+
+    return Response(stream_with_context(stream()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def can_view_job(job) -> bool:
+    user_id = session.get("user_id")
+    if user_id: return job["user_id"] == user_id
+    token = guest_token()
+    return bool(token) and job["guest_token"] == token
+
+# ---------- ZIP Export ----------
+# The archive is produced as a generator: zipfile writes into a sink that the
+# response drains after every 64 KiB of image data, and rows are read in
+# keyset batches, so memory stays flat no matter how many images are
+# exported. PNGs are stored uncompressed since deflate gains nothing on them.
+# Images and manifest.json come from one pass over the rows (the manifest is
+# spooled aside and stored last), so a render finishing or being deleted
+# mid-export can't leave the two out of step.
+
+EXPORT_CHUNK_SIZE = 64 * 1024
+EXPORT_MANIFEST_SPOOL_BYTES = 1024 * 1024
+EXPORT_BATCH_SIZE = 200
+EXPORT_COLUMNS = "id, category, subcategory, options_json, prompt, image_path, liked, favorited, created_at"
+
+class _ZipStreamSink:
+    """Write-only, non-seekable file object; zipfile falls back to data descriptors."""
+    def __init__(self):
+        self._chunks = []
+        self._offset = 0
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._offset
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data, self._chunks = b"".join(self._chunks), []
+        return data
+
+def _iter_export_rows(**query):
+    """Walk the selection in keyset batches so no read stays open while the response streams."""
+    before = None
+    while True:
+        sql, params = owned_renderings_query(EXPORT_COLUMNS, before=before, **query)
+        cur = get_db().cursor()
+        cur.execute(f"{sql} LIMIT ?", (*params, EXPORT_BATCH_SIZE))
+        rows = cur.fetchall()
+        yield from rows
+        if len(rows) < EXPORT_BATCH_SIZE: return
+        before = (rows[-1]["created_at"], rows[-1]["id"])
+
+def _export_arcname(row) -> str:
+    folder = re.sub(r"[^\w\- ]+", "", row["subcategory"]).strip() or "Rendering"
+    return f"{folder}/{row['id']}{Path(row['image_path']).suffix}"
+
+def stream_export_zip(**query):
+    sink = _ZipStreamSink()
+    with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_STORED) as archive, \
+            tempfile.SpooledTemporaryFile(max_size=EXPORT_MANIFEST_SPOOL_BYTES) as manifest:
+        manifest.write(b'{"exported_at": ' + json.dumps(datetime.utcnow().isoformat()).encode() + b', "renderings": [')
+        for n, row in enumerate(_iter_export_rows(**query)):
+            try:
+                src = open(STATIC_DIR / row["image_path"], "rb")
+            except FileNotFoundError:
+                src = None
+            if src is not None:
+                with src:
+                    info = zipfile.ZipInfo(_export_arcname(row), datetime.fromisoformat(row["created_at"]).timetuple()[:6])
+                    info.file_size = os.fstat(src.fileno()).st_size
+                    with archive.open(info, mode="w") as dest:
+                        while chunk := src.read(EXPORT_CHUNK_SIZE):
+                            dest.write(chunk)
+                            yield sink.drain()
+            entry = {"id": row["id"], "file": _export_arcname(row), "category": row["category"], "subcategory": row["subcategory"],
+                     "options": json.loads(row["options_json"] or "{}"), "prompt": row["prompt"], "liked": bool(row["liked"]),
+                     "favorited": bool(row["favorited"]), "created_at": row["created_at"], "missing": src is None}
+            manifest.write((b", " if n else b"") + json.dumps(entry).encode())
+        manifest.write(b"]}")
+
+        manifest.seek(0)
+        manifest_info = zipfile.ZipInfo("manifest.json", datetime.utcnow().timetuple()[:6])
+        manifest_info.compress_type = zipfile.ZIP_DEFLATED
+        with archive.open(manifest_info, mode="w") as dest:
+            while chunk := manifest.read(EXPORT_CHUNK_SIZE):
+                dest.write(chunk)
+                yield sink.drain()
+    yield sink.drain()
+
+@bp.route("/export.zip", methods=["GET", "POST"])
+def export_zip():
+    """Download renderings as a ZIP: scope=all|favorites|subcategory|selected."""
+    if not session.get("user_id") and not guest_token():
+        return jsonify({"error": "Nothing to export."}), 404
+    scope = request.values.get("scope", "all")
+    subcategory = request.values.get("subcategory")
+    ids = None
+    if scope == "selected":
+        try:
+            ids = [int(i) for i in re.split(r"[,\s]+", request.values.get("ids", "").strip("[] ")) if i]
+        except ValueError:
+            return jsonify({"error": "Invalid rendering ids."}), 400
+        if not ids: return jsonify({"error": "No renderings selected."}), 400
+    elif scope == "subcategory" and not subcategory:
+        return jsonify({"error": "A subcategory is required."}), 400
+    elif scope not in ("all", "favorites", "subcategory"):
+        return jsonify({"error": "Unknown export scope."}), 400
+    query = {"favorites_only": scope == "favorites", "subcategory": subcategory if scope == "subcategory" else None, "ids": ids}
+    label = re.sub(r"[^\w]+", "-", subcategory if scope == "subcategory" else scope).strip("-").lower()
+    filename = f"renderings-{label}-{datetime.utcnow():%Y%m%d}.zip"
+    return Response(stream_with_context(stream_export_zip(**query)), mimetype="application/zip",
+                    headers={"Content-Disposition": f'attachment; filename="{filename}"', "X-Accel-Buffering": "no"})
+
+# ---------- Maintenance: Reaper & Sweeper ----------
+# Deletes only stamp renderings.deleted_at. A background thread reaps those
+# rows in batches (files and derivatives first, then the rows) and
+# periodically sweeps for leftovers: renderings of expired or abandoned
+# guest sessions, image files no row references, derivatives whose source is
+# gone, and old finished jobs. Both are also exposed as CLI commands.
+
+_reaper_wake = threading.Event()
+_maintenance_started = False
+_maintenance_lock = threading.Lock()
+
+def wake_reaper():
+    _reaper_wake.set()
+
+def _rendering_files(image_path: str):
+    yield STATIC_DIR / image_path
+    for width in RESPONSIVE_WIDTHS:
+        yield derived_path(image_path, width)
+
+def reap_deleted_renderings(batch_size: int = REAPER_BATCH_SIZE, dry_run: bool = False) -> dict:
+    """Remove the files and rows of soft-deleted renderings, one batch at a time."""
+    stats = {"rows": 0, "files": 0, "bytes": 0}
+    conn = get_db()
+    cur = conn.cursor()
+    last_id = 0
+    while True:
+        cur.execute("SELECT id, image_path FROM renderings WHERE deleted_at IS NOT NULL AND id > ? ORDER BY id LIMIT ?", (last_id, batch_size))
+        batch = cur.fetchall()
+        if not batch: break
+        last_id = batch[-1]["id"]
+        for row in batch:
+            for path in _rendering_files(row["image_path"]):
+                try:
+                    size = path.stat().st_size
+                    if not dry_run: path.unlink()
+                except FileNotFoundError:
+                    continue
+                except OSError as e:
+                    logger.warning("Reaper could not delete %s: %s", path, e)
+                    continue
+                stats["files"] += 1
+                stats["bytes"] += size
+        stats["rows"] += len(batch)
+        if not dry_run:
+            ids = [row["id"] for row in batch]
+            cur.execute(f"DELETE FROM renderings WHERE id IN ({','.join('?' for _ in ids)}) AND deleted_at IS NOT NULL", ids)
+            conn.commit()
+    return stats
+
+def sweep_orphans(dry_run: bool = False) -> dict:
+    """Find and remove leftovers that no request will ever clean up."""
+    conn = get_db()
+    cur = conn.cursor()
+    now = datetime.utcnow()
+    stats = {}
+
+    # Guest renderings whose session expired or was cleared, and cookie-era ones
+    # past the point where their cookie could still be adopted.
+    abandoned = """user_id IS NULL AND deleted_at IS NULL AND (guest_token IS NOT NULL AND guest_token NOT IN
+                   (SELECT token FROM guest_sessions WHERE expires_at > ?)
+                   OR (guest_token IS NULL AND created_at < ?))"""
+    abandoned_params = (now.isoformat(), (now - timedelta(days=LEGACY_GUEST_GRACE_DAYS)).isoformat())
+    cur.execute(f"SELECT COUNT(*) FROM renderings WHERE {abandoned}", abandoned_params)
+    stats["abandoned_guest_renderings"] = cur.fetchone()[0]
+    cur.execute("SELECT COUNT(*) FROM guest_sessions WHERE expires_at <= ?", (now.isoformat(),))
+    stats["expired_guest_sessions"] = cur.fetchone()[0]
+    cutoff = (now - timedelta(days=JOB_RETENTION_DAYS)).isoformat()
+    cur.execute("SELECT COUNT(*) FROM render_jobs WHERE status IN ('done', 'failed') AND finished_at < ?", (cutoff,))
+    stats["old_jobs"] = cur.fetchone()[0]
+    if not dry_run:
+        cur.execute(f"UPDATE renderings SET deleted_at = ? WHERE {abandoned}", (now.isoformat(), *abandoned_params))
+        cur.execute("DELETE FROM guest_sessions WHERE expires_at <= ?", (now.isoformat(),))
+        cur.execute("DELETE FROM render_jobs WHERE status IN ('done', 'failed') AND finished_at < ?", (cutoff,))
+        conn.commit()
+
+    # Image files no row points at. The grace period protects renders whose
+    # file is written but whose batch hasn't committed its rows yet. While a
+    # storage migration runs, files are mid-move, so the file scans wait for
+    # the next sweep (a marker untouched for the grace period is a dead run).
+    grace_cutoff = time.time() - SWEEP_GRACE_SECONDS
+    try:
+        stats["migration_in_progress"] = _migration_marker().stat().st_mtime > grace_cutoff
+    except FileNotFoundError:
+        stats["migration_in_progress"] = False
+    if stats["migration_in_progress"]:
+        logger.info("Sweeper: skipping file scans while a storage migration is running")
+        return stats
+    cur.execute("SELECT image_path FROM renderings")
+    referenced = {row["image_path"] for row in cur.fetchall()}
+    orphan_files = orphan_bytes = 0
+    for path in RENDER_DIR.rglob("*"):
+        if not path.is_file() or path.relative_to(STATIC_DIR).as_posix() in referenced: continue
+        stat = path.stat()
+        if stat.st_mtime > grace_cutoff: continue
+        orphan_files += 1
+        orphan_bytes += stat.st_size
+        if not dry_run: path.unlink(missing_ok=True)
+    stats["orphan_files"], stats["orphan_bytes"] = orphan_files, orphan_bytes
+
+    stale_derivatives = 0
+    for width in RESPONSIVE_WIDTHS:
+        width_dir = DERIVED_DIR / str(width)
+        for path in width_dir.rglob("*") if width_dir.exists() else []:
+            if not path.is_file(): continue
+            stem = path.relative_to(width_dir).with_suffix("")
+            if (STATIC_DIR / stem.with_suffix(".png")).exists(): continue
+            stale_derivatives += 1
+            if not dry_run: path.unlink(missing_ok=True)
+    stats["stale_derivatives"] = stale_derivatives
+    return stats
+
+def storage_stats() -> dict:
+    cur = get_db().cursor()
+    cur.execute("""SELECT COUNT(*) AS total, SUM(deleted_at IS NOT NULL) AS pending_reap,
+                   SUM(user_id IS NULL AND deleted_at IS NULL) AS guest,
+                   SUM(duplicate_of IS NOT NULL AND deleted_at IS NULL) AS near_duplicates,
+                   SUM(phash IS NULL AND deleted_at IS NULL) AS unhashed FROM renderings""")
+    row = cur.fetchone()
+    files = [p.stat().st_size for p in RENDER_DIR.rglob("*") if p.is_file()]
+    derived = [p.stat().st_size for p in DERIVED_DIR.rglob("*") if p.is_file()] if DERIVED_DIR.exists() else []
+    cur.execute("SELECT COUNT(*) FROM guest_sessions")
+    return {"renderings": row["total"], "pending_reap": row["pending_reap"] or 0, "guest_renderings": row["guest"] or 0,
+            "near_duplicates": row["near_duplicates"] or 0, "unhashed": row["unhashed"] or 0,
+            "guest_sessions": cur.fetchone()[0], "render_files": len(files), "render_bytes": sum(files),
+            "derived_files": len(derived), "derived_bytes": sum(derived)}
+
+def _maintenance_loop():
+    last_sweep = time.monotonic()
+    while True:
+        _reaper_wake.wait(REAPER_INTERVAL_SECONDS)
+        _reaper_wake.clear()
+        try:
+            reaped = reap_deleted_renderings()
+            if reaped["rows"]:
+                logger.info("Reaper removed %(rows)d renderings (%(files)d files, %(bytes)d bytes)", reaped)
+            if hash_index.age() >= HASH_INDEX_MAX_AGE_SECONDS:
+                hash_index.refresh(rebuild=True)
+            if time.monotonic() - last_sweep >= SWEEP_INTERVAL_SECONDS:
+                last_sweep = time.monotonic()
+                logger.info("Sweeper: %s", sweep_orphans())
+        except Exception:
+            logger.exception("Background maintenance failed")
+
+def start_maintenance_thread():
+    global _maintenance_started
+    with _maintenance_lock:
+        if _maintenance_started or not MAINTENANCE_ENABLED: return
+        _maintenance_started = True
+    threading.Thread(target=_maintenance_loop, name="maintenance", daemon=True).start()
+
+@bp.cli.command("reap")
+@click.option("--dry-run", is_flag=True, help="Report what would be removed without deleting anything.")
+def reap_command(dry_run):
+    """Remove soft-deleted renderings and their files now."""
+    click.echo(json.dumps(reap_deleted_renderings(dry_run=dry_run), indent=2))
+
+@bp.cli.command("sweep")
+@click.option("--dry-run", is_flag=True, help="Report what would be removed without deleting anything.")
+@click.option("--stats", "stats_only", is_flag=True, help="Only print storage statistics.")
+def sweep_command(dry_run, stats_only):
+    """Find orphaned render files, stale derivatives and expired guest data."""
+    if stats_only:
+        click.echo(json.dumps(storage_stats(), indent=2))
+        return
+    result = sweep_orphans(dry_run=dry_run)
+    if not dry_run:
+        result["reaped"] = reap_deleted_renderings()
+    click.echo(json.dumps(result, indent=2))
+
 # ---------- Routes ----------
 
-@app.route("/")
+@bp.route("/")
 def index():
     return render_template("index.html", app_name=APP_NAME, user=current_user(), basic_rooms=BASIC_ROOMS)
 
-@app.post("/generate")
+@bp.post("/generate")
 def generate():
     description = request.form.get("description", "").strip()
     session['available_rooms'] = build_room_list(description)
     session['environment_context'] = description
     session['original_description'] = description
     
-    user_id = session.get("user_id")
-    new_rendering_ids = []
-    conn = get_db()
-    cur = conn.cursor()
-    
+    user_id, guest = render_owner()
     master_prompt_base = f"The architectural style and scene is: {description or 'a tasteful contemporary design'}."
     
+    specs = []
+    for subcategory in ("Front Exterior", "Back Exterior"):
+        prompt, negative_prompt = build_prompt(subcategory, master_prompt_base)
+        specs.append(render_spec("EXTERIOR", subcategory, {}, prompt, negative_prompt, description=description))
     try:
-        front_prompt, negative_prompt_front = build_prompt("Front Exterior", master_prompt_base)
-        front_rel_path = generate_image_via_google_ai(front_prompt, negative_prompt_front)
-        now = datetime.utcnow().isoformat()
-        cur.execute("INSERT INTO renderings (user_id, category, subcategory, options_json, prompt, image_path, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",(user_id, "EXTERIOR", "Front Exterior", json.dumps({}), front_prompt, front_rel_path, now))
-        conn.commit()
-        new_rendering_ids.append(cur.lastrowid)
-
-        back_prompt, negative_prompt_back = build_prompt("Back Exterior", master_prompt_base)
-        back_rel_path = generate_image_via_google_ai(back_prompt, negative_prompt_back)
-        now = datetime.utcnow().isoformat()
-        cur.execute("INSERT INTO renderings (user_id, category, subcategory, options_json, prompt, image_path, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",(user_id, "EXTERIOR", "Back Exterior", json.dumps({}), back_prompt, back_rel_path, now))
-        conn.commit()
-        new_rendering_ids.append(cur.lastrowid)
+        job_id = enqueue_render_job(specs, user_id, guest)
+    except RenderRejected as e:
+        flash(str(e), "danger")
+        return redirect(url_for("main.index"))
+    
+    session['pending_job_ids'] = (session.get('pending_job_ids', []) + [job_id])[-PENDING_JOBS_IN_SESSION:]
+    flash("Rendering your Front & Back exteriors. They will appear here as soon as they are ready.", "info")
+    return redirect(url_for("main.gallery"))
 
-    except Exception as e:
-        conn.close()
+@bp.post("/generate_house")
+def generate_house():
+    """Render both exteriors and every room of the house as one concurrent batch."""
+    description = request.form.get("description", "").strip()
+    rooms = build_room_list(description)
+    session['available_rooms'] = rooms
+    session['environment_context'] = description
+    session['original_description'] = description
+    
+    user_id, guest = render_owner()
+    exterior_prompt = f"The architectural style and scene is: {description or 'a tasteful contemporary design'}."
+    interior_prompt = f"The interior design style is: {description or 'a tasteful contemporary design'}."
+    
+    specs = []
+    for subcategory in ("Front Exterior", "Back Exterior"):
+        prompt, negative_prompt = build_prompt(subcategory, exterior_prompt)
+        specs.append(render_spec("EXTERIOR", subcategory, {}, prompt, negative_prompt, description=description))
+    for subcategory in rooms:
+        prompt, negative_prompt = build_prompt(subcategory, interior_prompt, {}, description or None)
+        specs.append(render_spec("ROOM", subcategory, {}, prompt, negative_prompt, description=description))
+    try:
+        job_id = enqueue_render_job(specs, user_id, guest)
+    except RenderRejected as e:
         flash(str(e), "danger")
-        return redirect(url_for("index"))
-    conn.close()
+        return redirect(url_for("main.index"))
     
-    session['new_rendering_ids'] = new_rendering_ids
-    if not user_id:
-        guest_ids = session.get('guest_rendering_ids', [])
-        guest_ids.extend(new_rendering_ids)
-        session['guest_rendering_ids'] = guest_ids
-    flash("Generated Front & Back exterior renderings!", "success")
-    return redirect(url_for("gallery"))
-
-@app.post("/generate_room")
+    session['pending_job_ids'] = (session.get('pending_job_ids', []) + [job_id])[-PENDING_JOBS_IN_SESSION:]
+    flash(f"Rendering the whole house ({len(specs)} views). They will appear here as soon as they are ready.", "info")
+    return redirect(url_for("main.gallery"))
+
+@bp.post("/generate_room")
 def generate_room():
     subcategory = request.form.get("subcategory")
+    if subcategory not in OPTIONS:
+        return jsonify({"error": "Unknown room."}), 400
     description = request.form.get("description", "")
     selected = {opt_name: request.form.get(opt_name) for opt_name in OPTIONS.get(subcategory, {}).keys()}
     
     environment_context = session.get('environment_context', 'a standard suburban neighborhood')
-    master_prompt = f"The interior design style is: {description or 'a tasteful contemporary design'}."
-    
-    prompt, negative_prompt = build_prompt(subcategory, master_prompt, selected, environment_context)
+    prompt, negative_prompt = build_prompt(subcategory, room_master_prompt(description), selected, environment_context)
     
+    user_id, guest = render_owner()
+    use_cache = request.form.get("fresh") != "1"
     try:
-        rel_path = generate_image_via_google_ai(prompt, negative_prompt)
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
-        
-    user_id = session.get("user_id")
-    conn = get_db()
-    cur = conn.cursor()
-    now = datetime.utcnow().isoformat()
-    cur.execute("INSERT INTO renderings (user_id, category, subcategory, options_json, prompt, image_path, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",(user_id, "ROOM", subcategory, json.dumps(selected), prompt, rel_path, now))
-    conn.commit()
-    new_id = cur.lastrowid
-    conn.close()
-    if not user_id:
-        guest_ids = session.get('guest_rendering_ids', [])
-        guest_ids.append(new_id)
-        session['guest_rendering_ids'] = guest_ids
-    return jsonify({"id": new_id, "path": url_for('static', filename=rel_path), "subcategory": subcategory, "message": f"Generated {subcategory} rendering!"})
+        job_id = enqueue_render_job([render_spec("ROOM", subcategory, selected, prompt, negative_prompt, use_cache, description)], user_id, guest)
+    except RenderRejected as e:
+        return rejected_response(str(e), e)
+    return jsonify({"job_id": job_id, "status_url": url_for('main.job_status', job_id=job_id), "subcategory": subcategory, "message": f"Rendering {subcategory}..."}), 202
+
+@bp.get("/jobs/<job_id>")
+def job_status(job_id):
+    job = get_render_job(job_id)
+    if not job or not can_view_job(job):
+        return jsonify({"error": "Job not found."}), 404
+    return jsonify(job_payload(job))
 
-@app.get("/gallery")
+@bp.get("/gallery")
 def gallery():
     user = current_user()
-    gallery_items = []
-    
-    if user:
-        conn = get_db()
-        cur = conn.cursor()
-        cur.execute("SELECT * FROM renderings WHERE user_id = ? ORDER BY created_at DESC", (user["id"],))
-        gallery_items = [dict(row) for row in cur.fetchall()]
-        conn.close()
-    else:
-        return redirect(url_for('session_gallery'))
-
-    renderings_by_cat = {}
-    for item in gallery_items:
-        cat = item['subcategory']
-        if cat not in renderings_by_cat:
-            renderings_by_cat[cat] = []
-        renderings_by_cat[cat].append(item)
+    if not user:
+        return redirect(url_for('main.session_gallery'))
 
     all_rooms = session.get('available_rooms', build_room_list(""))
     original_description = session.get('original_description', "No description provided.")
     
     return render_template("gallery.html", app_name=APP_NAME, user=user, 
-                           renderings_by_cat=renderings_by_cat, all_rooms=all_rooms,
-                           original_description=original_description, options=OPTIONS)
+                           all_rooms=all_rooms, original_description=original_description, options=OPTIONS,
+                           pending_jobs=session.pop('pending_job_ids', []))
 
-@app.get("/session_gallery")
+@bp.get("/session_gallery")
 def session_gallery():
     user = current_user()
-    if user: return redirect(url_for('gallery'))
-    items = []
-    guest_ids = session.get('guest_rendering_ids', [])
-    if guest_ids:
-        conn = get_db()
-        cur = conn.cursor()
-        q_marks = ",".join("?" for _ in guest_ids)
-        cur.execute(f"SELECT * FROM renderings WHERE id IN ({q_marks}) ORDER BY created_at DESC", guest_ids)
-        items = [dict(row) for row in cur.fetchall()]
-        conn.close()
-    
-    renderings_by_cat = {}
-    for item in items:
-        cat = item['subcategory']
-        if cat not in renderings_by_cat:
-            renderings_by_cat[cat] = []
-        renderings_by_cat[cat].append(item)
+    if user: return redirect(url_for('main.gallery'))
 
     all_rooms = session.get('available_rooms', build_room_list(""))
     original_description = session.get('original_description', "No description provided.")
     return render_template("gallery.html", app_name=APP_NAME, user=user, 
-                           renderings_by_cat=renderings_by_cat, all_rooms=all_rooms,
-                           original_description=original_description, options=OPTIONS)
+                           all_rooms=all_rooms, original_description=original_description, options=OPTIONS,
+                           pending_jobs=session.pop('pending_job_ids', []))
+
+# ---------- Gallery Listing API ----------
+# Cards are fetched one page at a time with keyset pagination on
+# (created_at, id), which the (user_id, subcategory, created_at, id) index
+# serves directly, so a page costs the same no matter how long the history is.
 
-@app.post("/bulk_action")
+GALLERY_PAGE_SIZE = 24
+GALLERY_MAX_PAGE_SIZE = 100
+GALLERY_CARD_COLUMNS = "id, subcategory, image_path, liked, favorited, created_at"
+
+def rendering_owner_filter(use_index: bool = True):
+    """SQL predicate and params restricting renderings to the current user or guest session.
+    use_index=False writes the owner test with unary + so SQLite can't drive the query from it."""
+    plus = "" if use_index else "+"
+    user_id = session.get("user_id")
+    if user_id:
+        return f"{plus}user_id = ?", [user_id]
+    token = guest_token()
+    if not token:
+        return "0", []
+    return f"{plus}guest_token = ?", [token]
+
+def encode_cursor(row) -> str:
+    return f"{row['created_at']}|{row['id']}"
+
+def decode_cursor(cursor: str):
+    created_at, _, rid = cursor.rpartition("|")
+    if not created_at or not rid.isdigit():
+        raise ValueError("Invalid cursor.")
+    return created_at, int(rid)
+
+def owned_renderings_filter(favorites_only: bool = False, subcategory: str = None, ids: list = None, before: tuple = None,
+                            options: dict = None, text: str = None, collapse_duplicates: bool = False):
+    """WHERE clause and params over the caller's live renderings, with optional search filters."""
+    # With an explicit id list, rowid probes beat walking the owner's (possibly huge) index.
+    where, params = rendering_owner_filter(use_index=ids is None)
+    clauses = [where, "deleted_at IS NULL"]
+    if favorites_only:
+        clauses.append("favorited = 1")
+    if subcategory:
+        clauses.append("subcategory = ?"); params.append(subcategory)
+    if ids is not None:
+        # One JSON parameter instead of one host parameter per id.
+        clauses.append("id IN (SELECT value FROM json_each(?))"); params.append(json.dumps(ids))
+    for name, values in (options or {}).items():
+        # Correlated probe of the (rendering_id, option_name) key: cheap per row, and the walk stops at the page limit.
+        clauses.append("EXISTS (SELECT 1 FROM rendering_options o WHERE o.rendering_id = renderings.id AND o.option_name = ?"
+                       " AND o.value IN (SELECT value FROM json_each(?)))")
+        params.extend([name, json.dumps(values)])
+    if text:
+        clause, text_params = text_search_clause(text)
+        clauses.append(clause); params.extend(text_params)
+    if collapse_duplicates:
+        # Hide renders whose cluster root is still live; the root stands in for them.
+        clauses.append("(duplicate_of IS NULL OR NOT EXISTS (SELECT 1 FROM renderings AS root"
+                       " WHERE root.id = renderings.duplicate_of AND root.deleted_at IS NULL))")
+    if before:
+        clauses.append("(created_at, id) < (?, ?)"); params.extend(before)
+    return " AND ".join(clauses), params
+
+def owned_renderings_query(columns: str = "*", favorites_only: bool = False, subcategory: str = None, ids: list = None, before: tuple = None,
+                           options: dict = None, text: str = None, collapse_duplicates: bool = False):
+    """SELECT over the caller's live renderings, newest first; shared by the gallery, slideshows and exports."""
+    where, params = owned_renderings_filter(favorites_only, subcategory, ids, before, options, text, collapse_duplicates)
+    return f"SELECT {columns} FROM renderings WHERE {where} ORDER BY created_at DESC, id DESC", params
+
+def list_renderings_page(cursor: str = None, limit: int = GALLERY_PAGE_SIZE, **filters):
+    sql, params = owned_renderings_query(GALLERY_CARD_COLUMNS, before=decode_cursor(cursor) if cursor else None, **filters)
+    cur = get_db().cursor()
+    cur.execute(f"{sql} LIMIT ?", (*params, limit + 1))
+    rows = cur.fetchall()
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return [dict(r) for r in rows[:limit]], next_cursor
+
+def gallery_filters_from_request() -> dict:
+    """subcategory, favorites, q, collapse and repeated option=Name:Value query args, as owned_renderings_filter kwargs."""
+    options = {}
+    for item in request.args.getlist("option"):
+        name, _, value = item.partition(":")
+        if name and value:
+            options.setdefault(name, []).append(value)
+    return {"subcategory": request.args.get("subcategory") or None, "favorites_only": request.args.get("favorites") == "1",
+            "options": options, "text": (request.args.get("q") or "").strip() or None,
+            "collapse_duplicates": request.args.get("collapse") == "1"}
+
+@bp.get("/api/renderings")
+def api_renderings():
+    limit = max(1, min(request.args.get("limit", GALLERY_PAGE_SIZE, type=int), GALLERY_MAX_PAGE_SIZE))
+    try:
+        items, next_cursor = list_renderings_page(request.args.get("cursor"), limit, **gallery_filters_from_request())
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"items": items, "next_cursor": next_cursor})
+
+# ---------- Search and Facets ----------
+# rendering_options holds one row per (rendering, option) pulled out of
+# options_json, and renderings_fts indexes only the user-written text of a
+# rendering (its description and option values, never the prompt template
+# every row shares) next to an owner token. Triggers on renderings keep both
+# in step with inserts, updates, guest claims and the reaper's deletes, so
+# neither needs application code to maintain. Option filters are correlated
+# probes of the (rendering_id, option_name) key, so a page walks only as many
+# of the caller's keyset-ordered rows as it needs; text search is one FTS
+# MATCH scoped to the caller's owner token, materialized up front. Facets count over the newest FACET_SCAN_LIMIT
+# matches so a very large history doesn't turn every filter change into a
+# full scan; the response says when the window was truncated.
+
+FACET_SCAN_LIMIT = int(os.getenv("FACET_SCAN_LIMIT", "2000"))
+
+_fts_available = None
+
+def init_search_index(cur):
+    """Create the options table, the FTS index and their triggers, backfilling existing rows."""
+    cur.execute("SELECT name FROM sqlite_master WHERE name IN ('rendering_options', 'renderings_fts')")
+    existing = {row[0] for row in cur.fetchall()}
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS rendering_options (
+        rendering_id INTEGER NOT NULL, option_name TEXT NOT NULL, value TEXT NOT NULL,
+        PRIMARY KEY (rendering_id, option_name)
+    ) WITHOUT ROWID""")
+    options_of = "json_each(CASE WHEN json_valid({0}.options_json) THEN {0}.options_json ELSE '{{}}' END)"
+    cur.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS renderings_options_ai AFTER INSERT ON renderings BEGIN
+        INSERT OR IGNORE INTO rendering_options (rendering_id, option_name, value)
+        SELECT new.id, key, value FROM {options_of.format("new")} WHERE type = 'text' AND value != '';
+    END""")
+    cur.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS renderings_options_au AFTER UPDATE OF options_json ON renderings BEGIN
+        DELETE FROM rendering_options WHERE rendering_id = old.id;
+        INSERT OR IGNORE INTO rendering_options (rendering_id, option_name, value)
+        SELECT new.id, key, value FROM {options_of.format("new")} WHERE type = 'text' AND value != '';
+    END""")
+    cur.execute("""
+    CREATE TRIGGER IF NOT EXISTS renderings_options_ad AFTER DELETE ON renderings BEGIN
+        DELETE FROM rendering_options WHERE rendering_id = old.id;
+    END""")
+    if "rendering_options" not in existing:
+        cur.execute(f"""INSERT OR IGNORE INTO rendering_options (rendering_id, option_name, value)
+                        SELECT r.id, j.key, j.value FROM renderings r, {options_of.format("r")} j
+                        WHERE j.type = 'text' AND j.value != ''""")
+    if "renderings_fts" in existing:
+        cur.execute("PRAGMA table_info(renderings_fts)")
+        if "owner" not in {row[1] for row in cur.fetchall()}:
+            # The first version indexed whole prompts as external content; rebuild it owner-scoped.
+            for trigger in ("renderings_fts_ai", "renderings_fts_au", "renderings_fts_ad"):
+                cur.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+            cur.execute("DROP TABLE renderings_fts")
+            existing.discard("renderings_fts")
+    try:
+        cur.execute("""CREATE VIRTUAL TABLE IF NOT EXISTS renderings_fts USING fts5(
+                       owner, body, tokenize='porter unicode61', prefix='2 3 4')""")
+    except sqlite3.OperationalError as e:
+        logger.warning("FTS5 is unavailable (%s); text search falls back to LIKE.", e)
+        return
+    owner_of = "CASE WHEN {0}.user_id IS NOT NULL THEN 'u' || {0}.user_id WHEN {0}.guest_token IS NOT NULL THEN 'g' || {0}.guest_token ELSE '' END"
+    body_of = ("COALESCE({0}.description, '') || ' ' || COALESCE((SELECT group_concat(value, ' ') FROM "
+               + options_of + " WHERE type = 'text'), '')")
+    fts_row = "{0}.id, " + owner_of + ", " + body_of
+    cur.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS renderings_fts_ai AFTER INSERT ON renderings BEGIN
+        INSERT INTO renderings_fts (rowid, owner, body) VALUES ({fts_row.format("new")});
+    END""")
+    cur.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS renderings_fts_au AFTER UPDATE OF description, options_json, user_id, guest_token ON renderings BEGIN
+        DELETE FROM renderings_fts WHERE rowid = old.id;
+        INSERT INTO renderings_fts (rowid, owner, body) VALUES ({fts_row.format("new")});
+    END""")
+    cur.execute("""
+    CREATE TRIGGER IF NOT EXISTS renderings_fts_ad AFTER DELETE ON renderings BEGIN
+        DELETE FROM renderings_fts WHERE rowid = old.id;
+    END""")
+    if "renderings_fts" not in existing:
+        cur.execute(f"INSERT INTO renderings_fts (rowid, owner, body) SELECT {fts_row.format('r')} FROM renderings r")
+
+def fts_available() -> bool:
+    global _fts_available
+    if _fts_available is None:
+        cur = get_db().cursor()
+        cur.execute("SELECT 1 FROM sqlite_master WHERE name = 'renderings_fts'")
+        _fts_available = cur.fetchone() is not None
+    return _fts_available
+
+def text_search_clause(text: str):
+    """Match every word of `text` (as a prefix) in the caller's descriptions and option values,
+    so user input can never be an FTS syntax error."""
+    terms = re.findall(r"\w+", text)
+    if not terms:
+        return "1", []
+    if fts_available():
+        user_id = session.get("user_id")
+        token = None if user_id else guest_token()
+        if not user_id and not token:
+            return "0", []
+        # ANDed with the owner's token (and with short prefixes served from the prefix index),
+        # FTS5 skips through the term's posting list, so a word common to everyone's renders stays cheap.
+        owner = f"u{user_id}" if user_id else f"g{token}"
+        terms_query = " ".join(f'"{t}"*' for t in terms)
+        return "id IN (SELECT rowid FROM renderings_fts WHERE renderings_fts MATCH ?)", [f'owner : "{owner}" AND body : ({terms_query})']
+    clauses = " AND ".join("(description LIKE ? OR options_json LIKE ?)" for _ in terms)
+    return f"({clauses})", [p for t in terms for p in (f"%{t}%", f"%{t}%")]
+
+def rendering_facets(**filters) -> dict:
+    """Counts per subcategory and per option value over the caller's newest FACET_SCAN_LIMIT matching renderings."""
+    where, params = owned_renderings_filter(**filters)
+    cur = get_db().cursor()
+    # One statement so the filter (and any FTS match) is evaluated once for both kinds of count.
+    cur.execute(f"""WITH scope AS (SELECT id, subcategory FROM renderings WHERE {where} ORDER BY created_at DESC, id DESC LIMIT ?)
+                    SELECT NULL AS option_name, subcategory AS value, COUNT(*) AS n FROM scope GROUP BY subcategory
+                    UNION ALL
+                    SELECT o.option_name, o.value, COUNT(*) FROM scope JOIN rendering_options o ON o.rendering_id = scope.id
+                    GROUP BY o.option_name, o.value
+                    ORDER BY option_name, n DESC""", (*params, FACET_SCAN_LIMIT))
+    subcategories, options = {}, {}
+    for row in cur.fetchall():
+        if row["option_name"] is None:
+            subcategories[row["value"]] = row["n"]
+        else:
+            options.setdefault(row["option_name"], {})[row["value"]] = row["n"]
+    total = sum(subcategories.values())
+    return {"total": total, "truncated": total >= FACET_SCAN_LIMIT, "subcategories": subcategories, "options": options}
+
+@bp.get("/api/renderings/facets")
+def api_rendering_facets():
+    return jsonify(rendering_facets(**gallery_filters_from_request()))
+
+# ---------- Perceptual Hashes ----------
+# Every render gets a 64-bit dHash (row gradients) and pHash (signs of the
+# low DCT band), stored as signed INTEGER columns. HashIndex holds them for
+# all live renders in NumPy arrays tagged by owner, so a lookup is an XOR and
+# popcount over the owner's slice rather than a table scan. The index only
+# narrows candidates: ownership and deletion are re-checked in SQL, so a stale
+# index can delay a result but never leak one. A render within
+# DUPLICATE_MAX_DISTANCE bits of an earlier one by the same owner is linked to
+# that cluster's root through duplicate_of, which the gallery's collapse
+# option filters on. NumPy is imported on first use to keep startup lean.
+
+NEAR_DUPLICATES = Counter("architect_near_duplicate_renders_total", "Renders saved as near-duplicates of an earlier render by the same owner.")
+SIMILAR_MAX_DISTANCE = int(os.getenv("SIMILAR_MAX_DISTANCE", "40"))
+DUPLICATE_MAX_DISTANCE = int(os.getenv("DUPLICATE_MAX_DISTANCE", "8"))
+HASH_INDEX_MAX_AGE_SECONDS = int(os.getenv("HASH_INDEX_MAX_AGE_SECONDS", "300"))
+_U64_MASK = (1 << 64) - 1
+
+_dct_basis = None
+
+def _dct_32():
+    global _dct_basis
+    if _dct_basis is None:
+        import numpy as np
+        n = np.arange(32)
+        _dct_basis = np.cos(np.pi * np.outer(n, 2 * n + 1) / 64)
+    return _dct_basis
+
+def _pack_bits(bits) -> int:
+    import numpy as np
+    return int(np.packbits(bits).view(">i8")[0])
+
+def _as_u64(values):
+    import numpy as np
+    return np.asarray(values, dtype=np.int64).view(np.uint64)
+
+def image_hashes(data: bytes) -> tuple:
+    """(dhash, phash) of an image as signed 64-bit ints, the form SQLite stores."""
+    import numpy as np
+    with PILImage.open(BytesIO(data)) as img:
+        gray = img.convert("L")
+    grad = np.asarray(gray.resize((9, 8), PILImage.Resampling.BOX), dtype=np.int16)
+    pixels = np.asarray(gray.resize((32, 32), PILImage.Resampling.BOX), dtype=np.float64)
+    low = (_dct_32() @ pixels @ _dct_32().T)[:8, :8].ravel()
+    return _pack_bits(grad[:, 1:] > grad[:, :-1]), _pack_bits(low > np.median(low[1:]))
+
+def hash_rendering_file(image_path: str):
+    try:
+        return image_hashes((STATIC_DIR / image_path).read_bytes())
+    except Exception as e:
+        logger.warning("Could not hash %s: %s", image_path, e)
+        return None
+
+def hash_distance(a: tuple, b: tuple) -> int:
+    return sum(bin((x ^ y) & _U64_MASK).count("1") for x, y in zip(a, b))
+
+class HashIndex:
+    """Owner-tagged dHash/pHash arrays over live renders. Requests extend it by id; the
+    maintenance thread rebuilds it every HASH_INDEX_MAX_AGE_SECONDS to drop deleted rows."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._arrays = None
+        self._guest_keys = {}
+        self._max_id = 0
+        self._loaded_at = None
+        self._stale = True
+
+    def _owner_key(self, user_id, guest_token):
+        """Array tag for an owner, or None for no owner or a guest with nothing indexed.
+        Ownerless rows are tagged 0, which no owner maps to."""
+        if user_id: return int(user_id)
+        return self._guest_keys.get(guest_token) if guest_token else None
+
+    def age(self) -> float:
+        return float("inf") if self._loaded_at is None else time.monotonic() - self._loaded_at
+
+    def invalidate(self):
+        """Rebuild on next refresh."""
+        with self._lock:
+            self._stale = True
+
+    def reassign_guest(self, guest_token: str, user_id: int):
+        """Mirror claim_guest_renderings in place; the incremental refresh can't see ownership changes."""
+        import numpy as np
+        with self._lock:
+            key = self._guest_keys.pop(guest_token, None)
+            if key is None or self._arrays is None: return
+            ids, owners, dhash, phash = self._arrays
+            self._arrays = (ids, np.where(owners == key, int(user_id), owners), dhash, phash)
+
+    def refresh(self, rebuild: bool = False, wait: bool = True):
+        """Load renders added since the last refresh, or everything when rebuilding."""
+        import numpy as np
+        # One refresher at a time; with wait=False a search just uses the arrays it has.
+        if not self._refresh_lock.acquire(blocking=wait): return
+        try:
+            with self._lock:
+                rebuild = rebuild or self._stale
+                self._stale = False
+                since = 0 if rebuild else self._max_id
+                guest_keys = {} if rebuild else dict(self._guest_keys)
+            cur = get_db().cursor()
+            cur.row_factory = None
+            cur.execute("""SELECT id, COALESCE(user_id, 0), dhash, phash FROM renderings
+                           WHERE id > ? AND phash IS NOT NULL AND deleted_at IS NULL ORDER BY id""", (since,))
+            rows = np.array(cur.fetchall(), dtype=np.int64).reshape(-1, 4)
+            if not len(rows) and not rebuild: return
+            until = int(rows[-1, 0]) if len(rows) else since
+            cur.execute("""SELECT id, guest_token FROM renderings
+                           WHERE id > ? AND id <= ? AND user_id IS NULL AND guest_token IS NOT NULL
+                           AND phash IS NOT NULL AND deleted_at IS NULL""", (since, until))
+            guests = cur.fetchall()
+            owners = rows[:, 1].copy()
+            if guests:
+                # Guest sessions are keyed by interned negative numbers, users by their id.
+                keys = [guest_keys.setdefault(token, -1 - len(guest_keys)) for _, token in guests]
+                owners[np.searchsorted(rows[:, 0], [rid for rid, _ in guests])] = keys
+            added = (rows[:, 0].copy(), owners, rows[:, 2].view(np.uint64), rows[:, 3].view(np.uint64))
+            with self._lock:
+                if rebuild or self._arrays is None:
+                    self._arrays = added
+                    self._loaded_at = time.monotonic()
+                else:
+                    self._arrays = tuple(np.concatenate(pair) for pair in zip(self._arrays, added))
+                self._guest_keys = guest_keys
+                self._max_id = until
+        finally:
+            self._refresh_lock.release()
+
+    def search(self, user_id, guest_token, hashes: tuple, max_distance: int, limit: int, refresh: bool = True,
+               exclude=()) -> list:
+        """[(rendering_id, distance)] of the owner's renders within max_distance bits, nearest (then oldest) first,
+        leaving out the ids in `exclude`."""
+        import numpy as np
+        if refresh: self.refresh(wait=False)
+        with self._lock:
+            owner_key = self._owner_key(user_id, guest_token)
+            if self._arrays is None or owner_key is None: return []
+            ids, owners, dhash, phash = self._arrays
+            mask = owners == owner_key
+            if exclude: mask &= ~np.isin(ids, list(exclude))
+            rows = np.flatnonzero(mask)
+        query_d, query_p = _as_u64(hashes)
+        dist = np.bitwise_count(dhash[rows] ^ query_d) + np.bitwise_count(phash[rows] ^ query_p)
+        keep = dist <= max_distance
+        rows, dist = rows[keep], dist[keep]
+        order = np.lexsort((ids[rows], dist))[:limit]
+        return [(int(ids[rows[i]]), int(dist[i])) for i in order]
+
+hash_index = HashIndex()
+
+def _owner_clause(user_id, guest_token):
+    return ("user_id = ?", [user_id]) if user_id else ("user_id IS NULL AND guest_token = ?", [guest_token])
+
+def find_duplicate_of(cur, user_id, guest_token, hashes: tuple, batch=()):
+    """Cluster root of the owner's nearest render within DUPLICATE_MAX_DISTANCE, or None.
+    `batch` holds (id, hashes) inserted earlier by the same, still uncommitted, job."""
+    candidates = hash_index.search(user_id, guest_token, hashes, DUPLICATE_MAX_DISTANCE, limit=20, refresh=False)
+    candidates += [(rid, d) for rid, other in batch if (d := hash_distance(hashes, other)) <= DUPLICATE_MAX_DISTANCE]
+    if not candidates: return None
+    ids = [rid for rid, _ in sorted(candidates, key=lambda c: (c[1], c[0]))]
+    owner_sql, owner_params = _owner_clause(user_id, guest_token)
+    cur.execute(f"""SELECT id, duplicate_of FROM renderings WHERE id IN (SELECT value FROM json_each(?))
+                    AND deleted_at IS NULL AND {owner_sql}""", (json.dumps(ids), *owner_params))
+    live = {row["id"]: row["duplicate_of"] for row in cur.fetchall()}
+    for rid in ids:
+        if rid in live: return live[rid] or rid
+    return None
+
+def relink_duplicates() -> int:
+    """Recompute duplicate_of for every live hashed render, walking each owner's renders oldest first."""
+    import numpy as np
+    conn = get_db()
+    cur = conn.cursor()
+    cur.execute("""SELECT id, user_id, guest_token, dhash, phash, duplicate_of FROM renderings
+                   WHERE phash IS NOT NULL AND deleted_at IS NULL ORDER BY id""")
+    by_owner, updates = {}, []
+    for row in cur.fetchall():
+        owner = (row["user_id"], None) if row["user_id"] else (None, row["guest_token"])
+        if owner == (None, None):
+            # Cookie-era guest renders have no owner to compare within; never link them.
+            if row["duplicate_of"] is not None: updates.append((None, row["id"]))
+            continue
+        by_owner.setdefault(owner, []).append(row)
+    linked = 0
+    for rows in by_owner.values():
+        dhash, phash = _as_u64([r["dhash"] for r in rows]), _as_u64([r["phash"] for r in rows])
+        roots = []
+        for i, row in enumerate(rows):
+            root = None
+            if i:
+                dist = np.bitwise_count(dhash[:i] ^ dhash[i]) + np.bitwise_count(phash[:i] ^ phash[i])
+                nearest = int(np.argmin(dist))
+                if dist[nearest] <= DUPLICATE_MAX_DISTANCE:
+                    root = roots[nearest] or rows[nearest]["id"]
+                    linked += 1
+            roots.append(root)
+            if root != row["duplicate_of"]:
+                updates.append((root, row["id"]))
+    cur.executemany("UPDATE renderings SET duplicate_of = ? WHERE id = ?", updates)
+    conn.commit()
+    return linked
+
+def backfill_render_hashes(batch_size: int = 500, workers: int = None) -> dict:
+    """Hash renders saved before hashing existed, then relink every owner's duplicate clusters."""
+    conn = get_db()
+    cur = conn.cursor()
+    stats = {"hashed": 0, "unreadable": 0, "near_duplicates": 0}
+    last_id = 0
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 4, thread_name_prefix="hash-backfill") as pool:
+        while True:
+            cur.execute("SELECT id, image_path FROM renderings WHERE phash IS NULL AND deleted_at IS NULL AND id > ? ORDER BY id LIMIT ?",
+                        (last_id, batch_size))
+            batch = cur.fetchall()
+            if not batch: break
+            last_id = batch[-1]["id"]
+            hashes = list(pool.map(hash_rendering_file, [row["image_path"] for row in batch]))
+            updates = [(*h, row["id"]) for row, h in zip(batch, hashes) if h]
+            cur.executemany("UPDATE renderings SET dhash = ?, phash = ? WHERE id = ?", updates)
+            conn.commit()
+            stats["hashed"] += len(updates)
+            stats["unreadable"] += len(batch) - len(updates)
+    stats["near_duplicates"] = relink_duplicates()
+    hash_index.invalidate()
+    return stats
+
+@bp.cli.command("hash-renders")
+@click.option("--batch-size", default=500, show_default=True, help="Rows hashed per transaction.")
+@click.option("--workers", type=int, default=None, help="Hashing threads (default: CPU count).")
+def hash_renders_command(batch_size, workers):
+    """Compute perceptual hashes for existing renders and link near-duplicates."""
+    click.echo(json.dumps(backfill_render_hashes(batch_size, workers), indent=2))
+
+@bp.get("/api/renderings/<int:rid>/similar")
+def api_similar_renderings(rid):
+    limit = max(1, min(request.args.get("limit", GALLERY_PAGE_SIZE, type=int), GALLERY_MAX_PAGE_SIZE))
+    max_distance = max(0, min(request.args.get("max_distance", SIMILAR_MAX_DISTANCE, type=int), 128))
+    conn = get_db()
+    cur = conn.cursor()
+    sql, params = owned_renderings_query("id, image_path, dhash, phash", ids=[rid])
+    cur.execute(sql, params)
+    row = cur.fetchone()
+    if not row:
+        return jsonify({"error": "Rendering not found."}), 404
+    hashes = (row["dhash"], row["phash"]) if row["phash"] is not None else hash_rendering_file(row["image_path"])
+    if hashes is None:
+        return jsonify({"error": "Rendering image could not be read."}), 409
+    if row["phash"] is None:
+        cur.execute("UPDATE renderings SET dhash = ?, phash = ? WHERE id = ?", (*hashes, rid))
+        conn.commit()
+    user_id = session.get("user_id")
+    owner = (user_id, None if user_id else guest_token())
+    # Deleted renders stay in the index until its next rebuild, so widen the
+    # candidate window until `limit` live matches turn up or the index runs out.
+    window = limit
+    while True:
+        matches = hash_index.search(*owner, hashes, max_distance, window, exclude=(rid,))
+        distances = dict(matches)
+        sql, params = owned_renderings_query(GALLERY_CARD_COLUMNS, ids=list(distances))
+        cur.execute(sql, params)
+        items = sorted((dict(r, distance=distances[r["id"]]) for r in cur.fetchall()), key=lambda r: (r["distance"], r["id"]))
+        if len(items) >= limit or len(matches) < window: break
+        window *= 4
+    return jsonify({"rendering_id": rid, "items": items[:limit]})
+
+# ---------- Option Sweeps ----------
+# A sweep renders every combination of the chosen options' values for one
+# room, holding the others fixed. The prompt prefix is compiled once and only
+# the selections differ per variant. Variants are identified by render_key
+# (the render cache digest): ones the caller already has or has queued are
+# skipped, and ones in the render cache join the batch without a rate-limit
+# charge since they never reach the backend. The rest are admitted up to the
+# caller's remaining tokens. Posting the same sweep again picks up whatever
+# was deferred, so the sweep page simply re-posts until nothing is left.
+
+SWEEP_MAX_VARIANTS = int(os.getenv("SWEEP_MAX_VARIANTS", "256"))
+
+def sweep_axes(subcategory: str, vary: list) -> dict:
+    """{option: [values]} from repeated vary=Name (every value) or vary=Name:Value args, in catalog order."""
+    catalog = OPTIONS.get(subcategory, {})
+    chosen = {}
+    for item in vary:
+        name, _, value = item.partition(":")
+        if name not in catalog:
+            raise ValueError(f"{subcategory} has no option named {name!r}.")
+        if value and value not in catalog[name]:
+            raise ValueError(f"{value!r} is not a choice for {name}.")
+        values = chosen.setdefault(name, set())
+        values.update([value] if value else catalog[name])
+    if not chosen:
+        raise ValueError("Choose at least one option to vary.")
+    return {name: [v for v in catalog[name] if v in chosen[name]] for name in catalog if name in chosen}
+
+def sweep_specs(subcategory: str, axes: dict, fixed: dict, description: str, environment_context: str) -> list:
+    base, negative_prompt = compile_prompt(subcategory, room_master_prompt(description), environment_context)
+    specs = []
+    for combo in itertools.product(*axes.values()):
+        varied = dict(zip(axes, combo))
+        # Same key order and empty values as generate_room, so equal choices give an equal render_key.
+        selected = {name: varied[name] if name in varied else fixed.get(name) for name in OPTIONS[subcategory]}
+        specs.append(render_spec("ROOM", subcategory, selected, base + option_selections(selected), negative_prompt, True, description))
+    return specs
+
+def owned_renders_by_key(keys: list) -> dict:
+    """The caller's newest live rendering for each render_key."""
+    where, params = rendering_owner_filter(use_index=False)
+    cur = get_db().cursor()
+    cur.execute(f"""SELECT id, image_path, render_key FROM renderings
+                    WHERE render_key IN (SELECT value FROM json_each(?)) AND deleted_at IS NULL AND {where} ORDER BY id""",
+                (json.dumps(keys), *params))
+    return {row["render_key"]: row for row in cur.fetchall()}
+
+def in_flight_render_jobs(user_id, guest_token) -> dict:
+    """render_key -> id of the owner's queued or running job that will produce it."""
+    owner_sql, owner_params = _owner_clause(user_id, guest_token)
+    cur = get_db().cursor()
+    cur.execute(f"SELECT id, specs_json FROM render_jobs WHERE {owner_sql} AND status IN ('queued', 'running')", owner_params)
+    return {spec.get("render_key"): row["id"] for row in cur.fetchall() for spec in json.loads(row["specs_json"])}
+
+def cached_render_keys(keys: list) -> set:
+    if not RENDER_CACHE_ENABLED or not keys: return set()
+    cur = get_db().cursor()
+    cur.execute("SELECT key FROM render_cache WHERE key IN (SELECT value FROM json_each(?))", (json.dumps(keys),))
+    return {row["key"] for row in cur.fetchall()}
+
+@bp.get("/sweep")
+def sweep_page():
+    rooms = ["Front Exterior", "Back Exterior"] + session.get('available_rooms', build_room_list(""))
+    return render_template("sweep.html", app_name=APP_NAME, user=current_user(), rooms=[r for r in rooms if r in OPTIONS],
+                           options=OPTIONS, max_variants=SWEEP_MAX_VARIANTS)
+
+@bp.post("/sweep")
+def sweep():
+    """Expand, de-duplicate and submit an option sweep; dry_run=1 only reports what would be rendered."""
+    subcategory = request.form.get("subcategory")
+    if subcategory not in OPTIONS:
+        return jsonify({"error": "Unknown room."}), 400
+    try:
+        axes = sweep_axes(subcategory, request.form.getlist("vary"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    total = math.prod(len(values) for values in axes.values())
+    if total > SWEEP_MAX_VARIANTS:
+        return jsonify({"error": f"This sweep has {total} variants; the limit is {SWEEP_MAX_VARIANTS}. Vary fewer options or values."}), 400
+    description = request.form.get("description", "")
+    fixed = {name: request.form.get(name) for name in OPTIONS[subcategory] if name not in axes}
+    environment_context = session.get('environment_context', 'a standard suburban neighborhood')
+    specs = sweep_specs(subcategory, axes, fixed, description, environment_context)
+
+    user_id, guest = render_owner()
+    keys = [spec["render_key"] for spec in specs]
+    rendered = owned_renders_by_key(keys)
+    queued = in_flight_render_jobs(user_id, guest)
+    pending = [spec for spec in specs if spec["render_key"] not in rendered and spec["render_key"] not in queued]
+    cached = cached_render_keys([spec["render_key"] for spec in pending])
+    free = [spec for spec in pending if spec["render_key"] in cached]
+    charged = [spec for spec in pending if spec["render_key"] not in cached]
+    job_id, deferred = None, set()
+    if pending and request.form.get("dry_run") != "1":
+        try:
+            admitted = admit_renders(len(charged), user_id, guest, partial=True)
+        except RenderRejected as e:
+            return rejected_response(f"Sweep not started: {e}", e)
+        deferred = {spec["render_key"] for spec in charged[admitted:]}
+        # Cache hits go in unpaid; should the entry be evicted before the job runs, the render is charged then.
+        for spec in free:
+            spec["charge_on_miss"] = rate_limit_key(user_id, guest)
+        job_id = create_render_job(free + charged[:admitted], user_id, guest)
+        queued.update((spec["render_key"], job_id) for spec in free + charged[:admitted])
+
+    def variant(spec):
+        key, row = spec["render_key"], rendered.get(spec["render_key"])
+        status = "rendered" if row else "queued" if key in queued else "deferred" if key in deferred else "pending"
+        return {"options": {name: spec["options"][name] for name in axes}, "status": status,
+                "rendering": {"id": row["id"], "image_path": row["image_path"]} if row else None}
+
+    variants = [variant(spec) for spec in specs]
+    # Every job still producing one of these variants, so the page can wait for all of them.
+    job_ids = sorted({queued[spec["render_key"]] for spec, v in zip(specs, variants) if v["status"] == "queued"})
+    payload = {"subcategory": subcategory, "axes": axes, "variants": variants, "job_id": job_id, "job_ids": job_ids,
+               "cached": len(free), "charged": len(charged) - len(deferred)}
+    payload.update({status: sum(v["status"] == status for v in variants) for status in ("rendered", "queued", "deferred", "pending")})
+    if job_id:
+        payload["status_url"] = url_for('main.job_status', job_id=job_id)
+    return jsonify(payload), 202 if job_id else 200
+
+@bp.get("/render_cache/stats")
+def render_cache_status():
+    return jsonify(render_cache_stats())
+
+@bp.post("/bulk_action")
 @login_required
 def bulk_action():
     action = request.form.get("action")
     ids_str = request.form.get("ids")
     if not ids_str: return jsonify({"error": "No renderings selected."}), 400
-    ids = json.loads(ids_str)
-    
+    try:
+        ids = json.loads(ids_str)
+    except ValueError:
+        ids = None
+    if not isinstance(ids, list) or not all(type(i) is int for i in ids):
+        return jsonify({"error": "ids must be a JSON list of rendering ids."}), 400
+    # One JSON parameter instead of one host parameter per id.
+    ids_json = json.dumps(ids)
+
     conn = get_db()
     cur = conn.cursor()
     user_id = session["user_id"]
 
     if action == "delete":
-        if not ids: conn.close(); return jsonify({"error": "No renderings selected for deletion."}), 400
-        q_marks = ",".join("?" for _ in ids)
-        cur.execute(f"SELECT image_path FROM renderings WHERE id IN ({q_marks}) AND user_id = ?", (*ids, user_id))
-        paths_to_delete = [row['image_path'] for row in cur.fetchall()]
-        for rel_path in paths_to_delete:
-            try: (STATIC_DIR / rel_path).unlink(missing_ok=True)
-            except Exception as e: print(f"Error deleting file {rel_path}: {e}")
-        cur.execute(f"DELETE FROM renderings WHERE id IN ({q_marks}) AND user_id = ?", (*ids, user_id))
+        if not ids: return jsonify({"error": "No renderings selected for deletion."}), 400
+        # Soft-delete only; the reaper removes files and rows in the background.
+        cur.execute("UPDATE renderings SET deleted_at = ? WHERE id IN (SELECT value FROM json_each(?)) AND user_id = ? AND deleted_at IS NULL",
+                    (datetime.utcnow().isoformat(), ids_json, user_id))
         conn.commit()
-        conn.close()
-        return jsonify({"message": f"Deleted {len(ids)} rendering(s)."}), 200
+        wake_reaper()
+        return jsonify({"message": f"Deleted {cur.rowcount} rendering(s)."}), 200
 
     elif action in ("like", "favorite"):
         field = "liked" if action == "like" else "favorited"
-        q_marks = ",".join("?" for _ in ids)
-        cur.execute(f"UPDATE renderings SET {field} = 1 - {field} WHERE id IN ({q_marks}) AND user_id = ?", (*ids, user_id))
+        cur.execute(f"UPDATE renderings SET {field} = 1 - {field} WHERE id IN (SELECT value FROM json_each(?)) AND user_id = ? AND deleted_at IS NULL",
+                    (ids_json, user_id))
         conn.commit()
-        conn.close()
-        return jsonify({"message": f"Toggled {action} for {len(ids)} rendering(s)."}), 200
+        return jsonify({"message": f"Toggled {action} for {cur.rowcount} rendering(s)."}), 200
 
-    conn.close()
     return jsonify({"error": "Unknown action."}), 400
 
-@app.get("/clear_session")
+@bp.get("/clear_session")
 def clear_session():
-    session.pop('guest_rendering_ids', None)
+    token = session.pop('guest_token', None)
+    if token:
+        # Expire the server-side session and queue its renderings for the reaper.
+        now = datetime.utcnow().isoformat()
+        conn = get_db()
+        conn.execute("UPDATE guest_sessions SET expires_at = ? WHERE token = ?", (now, token))
+        conn.execute("UPDATE renderings SET deleted_at = ? WHERE guest_token = ? AND user_id IS NULL AND deleted_at IS NULL", (now, token))
+        conn.commit()
+        wake_reaper()
     session.pop('available_rooms', None)
     session.pop('environment_context', None)
     session.pop('original_description', None)
     flash("Your session has been cleared.", "success")
-    return redirect(url_for("index"))
+    return redirect(url_for("main.index"))
 
-@app.post("/delete_session_rendering/<int:rid>")
+@bp.post("/delete_session_rendering/<int:rid>")
 def delete_session_rendering(rid):
-    guest_ids = session.get('guest_rendering_ids', [])
-    if rid in guest_ids:
-        guest_ids.remove(rid)
-        session['guest_rendering_ids'] = guest_ids
-        return jsonify({"message": "Rendering removed from session."}), 200
+    token = guest_token()
+    if token:
+        conn = get_db()
+        cur = conn.execute("UPDATE renderings SET deleted_at = ? WHERE id = ? AND guest_token = ? AND user_id IS NULL AND deleted_at IS NULL",
+                           (datetime.utcnow().isoformat(), rid, token))
+        conn.commit()
+        if cur.rowcount:
+            wake_reaper()
+            return jsonify({"message": "Rendering removed from session."}), 200
     return jsonify({"error": "Rendering not found in session."}), 404
 
-@app.get("/slideshow")
+@bp.get("/slideshow")
 @login_required
 def slideshow():
-    conn = get_db()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM renderings WHERE favorited = 1 AND user_id = ? ORDER BY created_at DESC", (session["user_id"],))
+    cur = get_db().cursor()
+    cur.execute(*owned_renderings_query(favorites_only=True))
     items = [dict(r) for r in cur.fetchall()]
-    conn.close()
     if len(items) < 2:
         flash("Favorite at least two renderings to start a slideshow.", "info")
-        return redirect(url_for("gallery"))
+        return redirect(url_for("main.gallery"))
     return render_template("slideshow.html", app_name=APP_NAME, user=current_user(), items=items)
 
-@app.get("/session_slideshow")
+@bp.get("/session_slideshow")
 def session_slideshow():
-    guest_ids = session.get('guest_rendering_ids', [])
-    if len(guest_ids) < 2:
-        flash("You need at least two session renderings for a slideshow.", "info")
-        return redirect(url_for('gallery'))
-    conn = get_db()
-    cur = conn.cursor()
-    q_marks = ",".join("?" for _ in guest_ids)
-    cur.execute(f"SELECT * FROM renderings WHERE id IN ({q_marks})", guest_ids)
+    cur = get_db().cursor()
+    cur.execute(*owned_renderings_query())
     items = [dict(row) for row in cur.fetchall()]
-    conn.close()
+    if len(items) < 2:
+        flash("You need at least two session renderings for a slideshow.", "info")
+        return redirect(url_for('main.gallery'))
     return render_template("slideshow.html", app_name=APP_NAME, user=None, items=items)
 
-@app.post("/modify_rendering/<int:rid>")
+@bp.post("/modify_rendering/<int:rid>")
 def modify_rendering(rid):
     description = request.form.get("description", "")
     conn = get_db()
     cur = conn.cursor()
     user_id = session.get("user_id")
-    guest_ids = session.get('guest_rendering_ids', [])
-    cur.execute("SELECT * FROM renderings WHERE id=?", (rid,))
+    token = None if user_id else guest_token()
+    cur.execute("SELECT * FROM renderings WHERE id=? AND deleted_at IS NULL", (rid,))
     row = cur.fetchone()
     if not row:
-        conn.close(); return jsonify({"error": "Rendering not found."}), 404
-    if row['user_id'] != user_id and (user_id or row['id'] not in guest_ids):
-        conn.close(); return jsonify({"error": "Permission denied."}), 403
+        return jsonify({"error": "Rendering not found."}), 404
+    owns = row['user_id'] == user_id if user_id else bool(token) and row['guest_token'] == token
+    if not owns:
+        return jsonify({"error": "Permission denied."}), 403
     subcategory = row["subcategory"]
     original_options = json.loads(row["options_json"] or "{}")
     selected = {opt: request.form.get(opt) or original_options.get(opt) for opt in OPTIONS.get(subcategory, {}).keys()}
@@ -424,21 +2743,14 @@ def modify_rendering(rid):
     master_prompt = f"The architectural style is: {description or 'a tasteful contemporary design'}."
     prompt, negative_prompt = build_prompt(subcategory, master_prompt, selected, environment_context)
     try:
-        rel_path = generate_image_via_google_ai(prompt, negative_prompt)
-    except Exception as e:
-        conn.close(); return jsonify({"error": f"Modification failed: {e}"}), 500
-    now = datetime.utcnow().isoformat()
-    cur.execute("INSERT INTO renderings (user_id, category, subcategory, options_json, prompt, image_path, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)", (user_id, row["category"], subcategory, json.dumps(selected), prompt, rel_path, now))
-    conn.commit()
-    new_id = cur.lastrowid
-    conn.close()
-    if not user_id:
-        guest_ids.append(new_id)
-        session['guest_rendering_ids'] = guest_ids
-    return jsonify({"id": new_id, "path": url_for('static', filename=rel_path), "subcategory": subcategory, "message": f"Modified {subcategory} rendering!"})
+        # "Regenerate" asks for a new take, so it never reuses a cached image.
+        job_id = enqueue_render_job([render_spec(row["category"], subcategory, selected, prompt, negative_prompt, use_cache=False, description=description)], user_id, token)
+    except RenderRejected as e:
+        return rejected_response(f"Modification failed: {e}", e)
+    return jsonify({"job_id": job_id, "status_url": url_for('main.job_status', job_id=job_id), "subcategory": subcategory, "message": f"Modifying {subcategory} rendering..."}), 202
 
 # ---------- Auth Routes ----------
-@app.route("/register", methods=["GET", "POST"])
+@bp.route("/register", methods=["GET", "POST"])
 def register():
     if request.method == "POST":
         email = (request.form.get("email") or "").strip().lower()
@@ -446,26 +2758,26 @@ def register():
         password = request.form.get("password") or ""
         if not email or not password:
             flash("Email and password are required.", "warning")
-            return redirect(url_for("register"))
+            return redirect(url_for("main.register"))
         conn = get_db()
         cur = conn.cursor()
         cur.execute("SELECT id FROM users WHERE email = ?", (email,))
         if cur.fetchone():
-            conn.close(); flash("Email already registered.", "warning")
-            return redirect(url_for("register"))
+            flash("Email already registered.", "warning")
+            return redirect(url_for("main.register"))
         pwd_hash = generate_password_hash(password)
         cur.execute("INSERT INTO users (email, name, password_hash, created_at) VALUES (?, ?, ?, ?)", (email, name, pwd_hash, datetime.utcnow().isoformat()))
         conn.commit()
         user_id = cur.lastrowid
-        conn.close()
+        claim_guest_renderings(user_id)
         session.clear()
         session["user_id"] = user_id
         session["user_email"] = email
         flash("Welcome! Account created.", "success")
-        return redirect(url_for("gallery"))
+        return redirect(url_for("main.gallery"))
     return render_template("register.html", app_name=APP_NAME, user=current_user())
 
-@app.route("/login", methods=["GET", "POST"])
+@bp.route("/login", methods=["GET", "POST"])
 def login():
     if request.method == "POST":
         email = (request.form.get("email") or "").strip().lower()
@@ -474,23 +2786,38 @@ def login():
         cur = conn.cursor()
         cur.execute("SELECT * FROM users WHERE email = ?", (email,))
         user = cur.fetchone()
-        conn.close()
         if user and check_password_hash(user["password_hash"], password):
+            claim_guest_renderings(user["id"])
             session.clear()
             session["user_id"] = user["id"]
             session["user_email"] = user["email"]
             flash("Logged in successfully.", "success")
             nxt = request.args.get("next")
-            return redirect(nxt or url_for("gallery"))
+            return redirect(nxt or url_for("main.gallery"))
         flash("Invalid credentials.", "danger")
-        return redirect(url_for("login"))
+        return redirect(url_for("main.login"))
     return render_template("login.html", app_name=APP_NAME, user=current_user())
 
-@app.get("/logout")
+@bp.get("/logout")
 def logout():
     session.clear()
     flash("Logged out.", "info")
-    return redirect(url_for("index"))
+    return redirect(url_for("main.index"))
+
+# ---------- Application Factory ----------
+
+def create_app(init_storage_now: bool = None) -> Flask:
+    """Build the app; directories, tables and migrations are set up here once per process
+    unless INIT_ON_STARTUP=0, in which case run `flask --app app init-db` at deploy time."""
+    flask_app = Flask(__name__, template_folder=str(TEMPLATES_DIR), static_folder=str(STATIC_DIR))
+    flask_app.config["SECRET_KEY"] = SECRET_KEY
+    flask_app.register_blueprint(bp)
+    flask_app.teardown_appcontext(close_db)
+    if INIT_ON_STARTUP if init_storage_now is None else init_storage_now:
+        init_storage()
+    return flask_app
+
+app = create_app()
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=int(os.getenv("PORT", "5000")), debug=True)
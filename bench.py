@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+"""
+Load benchmark for the Architect 3D Home Modeler.
+
+Drives /generate, /generate_room, /gallery, /api/renderings, /bulk_action and
+/slideshow at fixed concurrency levels and reports p50/p95/p99 latency and
+throughput per scenario. Results are written as JSON so two runs (e.g. two
+releases) can be compared with --baseline.
+
+In-process (default): runs the app with the Flask test client against a
+throwaway database and the FakeBackend, so no GCP credentials are needed.
+
+    python bench.py --concurrency 1,4,16 --requests 200
+    python bench.py --baseline bench_results/v1.json --tolerance 0.15
+    python bench.py --scenarios "" --startup-runs 10     # cold-start timing only
+
+Against a running server (start it with IMAGE_BACKEND=fake and render rate
+limits high enough for the load you plan to send):
+
+    IMAGE_BACKEND=fake FAKE_BACKEND_LATENCY_MS=300 RATE_LIMIT_USER_PER_MINUTE=100000 \
+        RATE_LIMIT_USER_BURST=1000 RATE_LIMIT_GLOBAL_PER_MINUTE=100000 RATE_LIMIT_GLOBAL_BURST=1000 python app.py
+    python bench.py --url http://127.0.0.1:5001
+"""
+
+import argparse
+import http.cookiejar
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+SCENARIOS = ("generate", "generate_room", "gallery", "gallery_api", "bulk_action", "slideshow")
+ROOM_SUBCATEGORIES = ("Living Room", "Kitchen", "Primary Bedroom", "Home Office")
+
+# ---------- Clients ----------
+# Both clients expose request(method, path, data) -> (status, headers, body)
+# and keep their own cookies, so each worker is an independent logged-in user.
+
+class InProcessClient:
+    def __init__(self, flask_app):
+        self.client = flask_app.test_client()
+
+    def request(self, method, path, data=None):
+        resp = self.client.open(path, method=method, data=data)
+        return resp.status_code, resp.headers, resp.get_data()
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+class HttpClient:
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip("/")
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect())
+
+    def request(self, method, path, data=None):
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        req = urllib.request.Request(self.base_url + path, data=body, method=method)
+        try:
+            with self.opener.open(req, timeout=60) as resp:
+                return resp.status, resp.headers, resp.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.headers, e.read()
+
+# ---------- Setup ----------
+
+def make_inprocess_factory(args):
+    """Import the app against a scratch directory and install a FakeBackend."""
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+    os.environ["INIT_ON_STARTUP"] = "0"
+    import app as A
+    scratch = Path(tempfile.mkdtemp(prefix="a3d-bench-"))
+    A.DB_PATH = scratch / "bench.db"
+    A.UPLOAD_DIR = scratch / "uploads"
+    A.STATIC_DIR = scratch / "static"
+    A.RENDER_DIR = A.STATIC_DIR / "renderings"
+    A.RENDER_CACHE_DIR = scratch / "render_cache"
+    A.DERIVED_DIR = scratch / "derived"
+    A.MAINTENANCE_ENABLED = False
+    A.app.static_folder = str(A.STATIC_DIR)
+    A.init_storage()
+    if not args.keep_rate_limits:
+        A.render_limiter = A.RateLimiter(1e9, 10**9, 1e9, 10**9)
+    A.set_image_backend(A.FakeBackend(args.fake_latency_ms, args.fake_jitter_ms, args.fake_failure_rate, seed=args.seed))
+    return (lambda: InProcessClient(A.app)), A
+
+def drain_render_queue(A, timeout):
+    """Wait for in-process render jobs so one scenario's backlog doesn't skew the next."""
+    deadline = time.monotonic() + timeout
+    while A._pending_jobs and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+def login_new_user(client):
+    email = f"bench-{uuid.uuid4().hex[:12]}@example.com"
+    status, _, _ = client.request("POST", "/register", {"email": email, "name": "Bench", "password": "bench-password"})
+    if status not in (200, 302):
+        raise RuntimeError(f"Registering a benchmark user failed with HTTP {status}.")
+
+def wait_for_jobs(client, job_ids, timeout):
+    """Poll /jobs until every job settles; returns the final payloads."""
+    pending, done = set(job_ids), {}
+    deadline = time.monotonic() + timeout
+    while pending and time.monotonic() < deadline:
+        for job_id in list(pending):
+            status, _, body = client.request("GET", f"/jobs/{job_id}")
+            if status != 200: pending.discard(job_id); continue
+            payload = json.loads(body)
+            if payload["status"] in ("done", "failed"):
+                done[job_id] = payload
+                pending.discard(job_id)
+        if pending: time.sleep(0.1)
+    return list(done.values())
+
+def seed_renderings(client, count, timeout):
+    """Render `count` rooms for this user, favorite them, and return their ids."""
+    job_ids = []
+    for i in range(count):
+        status, _, body = client.request("POST", "/generate_room", {"subcategory": ROOM_SUBCATEGORIES[i % len(ROOM_SUBCATEGORIES)]})
+        if status == 202: job_ids.append(json.loads(body)["job_id"])
+    ids = [r["id"] for job in wait_for_jobs(client, job_ids, timeout) for r in job["renderings"]]
+    if ids:
+        client.request("POST", "/bulk_action", {"action": "favorite", "ids": json.dumps(ids)})
+    return ids
+
+# ---------- Scenarios ----------
+# Each returns (ok, job_id or None). Render scenarios measure enqueue latency;
+# end-to-end render time is reported separately from the jobs' timestamps.
+
+def run_scenario(name, client, rng, rendering_ids):
+    if name == "generate":
+        status, headers, _ = client.request("POST", "/generate", {"description": f"bench house {rng.randrange(10**6)}"})
+        return status == 302 and "/gallery" in headers.get("Location", ""), None
+    if name == "generate_room":
+        status, _, body = client.request("POST", "/generate_room",
+                                         {"subcategory": rng.choice(ROOM_SUBCATEGORIES), "description": f"bench {rng.randrange(10**6)}"})
+        return status == 202, json.loads(body)["job_id"] if status == 202 else None
+    if name == "gallery":
+        return client.request("GET", "/gallery")[0] == 200, None
+    if name == "gallery_api":
+        return client.request("GET", "/api/renderings")[0] == 200, None
+    if name == "bulk_action":
+        ids = rng.sample(rendering_ids, min(5, len(rendering_ids)))
+        return client.request("POST", "/bulk_action", {"action": "like", "ids": json.dumps(ids)})[0] == 200, None
+    if name == "slideshow":
+        return client.request("GET", "/slideshow")[0] == 200, None
+    raise ValueError(f"Unknown scenario {name!r}")
+
+def percentile(sorted_values, pct):
+    if not sorted_values: return None
+    rank = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+def summarize(latencies):
+    values = sorted(latencies)
+    ms = lambda v: round(v * 1000, 2) if v is not None else None
+    return {"p50_ms": ms(percentile(values, 50)), "p95_ms": ms(percentile(values, 95)),
+            "p99_ms": ms(percentile(values, 99)),
+            "mean_ms": ms(sum(values) / len(values)) if values else None}
+
+def run_level(name, workers, total_requests, args):
+    """Fire `total_requests` at one scenario from len(workers) threads."""
+    latencies, job_ids, errors = [], [], 0
+    lock = threading.Lock()
+    remaining = [total_requests]
+
+    def worker(index, client, rendering_ids):
+        nonlocal errors
+        rng = random.Random(f"{args.seed}-{name}-{len(workers)}-{index}")
+        while True:
+            with lock:
+                if remaining[0] <= 0: return
+                remaining[0] -= 1
+            started = time.perf_counter()
+            try:
+                ok, job_id = run_scenario(name, client, rng, rendering_ids)
+            except Exception:
+                ok, job_id = False, None
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                if not ok: errors += 1
+                if job_id: job_ids.append((client, job_id))
+
+    threads = [threading.Thread(target=worker, args=(i, c, ids), daemon=True) for i, (c, ids) in enumerate(workers)]
+    started = time.perf_counter()
+    for t in threads: t.start()
+    for t in threads: t.join()
+    wall = time.perf_counter() - started
+    result = {"scenario": name, "concurrency": len(workers), "requests": len(latencies), "errors": errors,
+              "throughput_rps": round(len(latencies) / wall, 2) if wall else None, **summarize(latencies)}
+    if job_ids and args.render_timeout > 0:
+        render_seconds = []
+        for job in _settle(job_ids, args.render_timeout):
+            if job["status"] == "done" and job["finished_at"]:
+                render_seconds.append((datetime.fromisoformat(job["finished_at"]) - datetime.fromisoformat(job["created_at"])).total_seconds())
+        result["render"] = {"completed": len(render_seconds), **summarize(render_seconds)}
+    return result
+
+def _settle(job_ids, timeout):
+    by_client = {}
+    for client, job_id in job_ids:
+        by_client.setdefault(client, []).append(job_id)
+    return [job for client, ids in by_client.items() for job in wait_for_jobs(client, ids, timeout)]
+
+# ---------- Startup ----------
+# Each run is a fresh interpreter: import the module (without storage init),
+# build an app against scratch storage, then serve one request. This is what
+# a new gunicorn worker pays before it can take traffic.
+
+STARTUP_PROBE = r"""
+import json, os, sys, tempfile, time
+from pathlib import Path
+os.environ["INIT_ON_STARTUP"] = "0"
+sys.path.insert(0, sys.argv[1])
+t0 = time.perf_counter()
+import app as A
+t1 = time.perf_counter()
+scratch = Path(tempfile.mkdtemp(prefix="a3d-startup-"))
+A.DB_PATH, A.UPLOAD_DIR, A.STATIC_DIR = scratch / "a.db", scratch / "uploads", scratch / "static"
+A.RENDER_DIR, A.RENDER_CACHE_DIR, A.DERIVED_DIR = A.STATIC_DIR / "renderings", scratch / "cache", scratch / "derived"
+A.MAINTENANCE_ENABLED = False
+flask_app = A.create_app(init_storage_now=True)
+t2 = time.perf_counter()
+status = flask_app.test_client().get("/login").status_code
+t3 = time.perf_counter()
+print(json.dumps({"import": t1 - t0, "create_app": t2 - t1, "first_request": t3 - t2, "status": status,
+                  "vertex_imported": "vertexai" in sys.modules}))
+"""
+
+def run_startup(runs):
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        out = subprocess.run([sys.executable, "-c", STARTUP_PROBE, str(Path(__file__).resolve().parent)],
+                             capture_output=True, text=True, check=True, env={**os.environ, "IMAGE_BACKEND": "fake"})
+        sample = json.loads(out.stdout.strip().splitlines()[-1])
+        sample["process"] = time.perf_counter() - started
+        samples.append(sample)
+    result = {"runs": runs, "vertex_imported": any(s["vertex_imported"] for s in samples)}
+    for phase in ("import", "create_app", "first_request", "process"):
+        result[phase] = summarize([s[phase] for s in samples])
+    return result
+
+# ---------- Reporting ----------
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=Path(__file__).resolve().parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def print_table(results):
+    print(f"{'scenario':<14}{'conc':>5}{'reqs':>7}{'errs':>6}{'rps':>9}{'p50':>10}{'p95':>10}{'p99':>10}{'render p95':>12}")
+    for r in results:
+        render_p95 = (r.get("render") or {}).get("p95_ms")
+        print(f"{r['scenario']:<14}{r['concurrency']:>5}{r['requests']:>7}{r['errors']:>6}{r['throughput_rps'] or 0:>9.1f}"
+              f"{r['p50_ms'] or 0:>10.1f}{r['p95_ms'] or 0:>10.1f}{r['p99_ms'] or 0:>10.1f}"
+              f"{render_p95 if render_p95 is not None else '-':>12}")
+
+def print_startup(startup):
+    print(f"\nstartup ({startup['runs']} runs, vertexai imported: {startup['vertex_imported']})")
+    for phase in ("import", "create_app", "first_request", "process"):
+        print(f"  {phase:<14} p50 {startup[phase]['p50_ms']:>8.1f} ms   p95 {startup[phase]['p95_ms']:>8.1f} ms")
+
+def compare(results, baseline, tolerance, startup=None):
+    """Print per-row deltas against a baseline run; returns the regressed rows."""
+    previous = {(r["scenario"], r["concurrency"]): r for r in baseline["results"]}
+    regressions = []
+    print(f"\nvs baseline {baseline['meta'].get('git_revision') or ''} ({baseline['meta'].get('timestamp')}):")
+    for r in results:
+        old = previous.get((r["scenario"], r["concurrency"]))
+        if not old or not old.get("p95_ms") or not r.get("p95_ms"): continue
+        p95_delta = r["p95_ms"] / old["p95_ms"] - 1
+        rps_delta = r["throughput_rps"] / old["throughput_rps"] - 1 if old.get("throughput_rps") else 0
+        regressed = p95_delta > tolerance or rps_delta < -tolerance
+        if regressed: regressions.append(r)
+        print(f"  {r['scenario']:<14}c={r['concurrency']:<4} p95 {p95_delta:+.1%}  rps {rps_delta:+.1%}{'  REGRESSION' if regressed else ''}")
+    old_startup = baseline.get("startup")
+    if startup and old_startup:
+        delta = startup["process"]["p50_ms"] / old_startup["process"]["p50_ms"] - 1
+        regressed = delta > tolerance
+        if regressed: regressions.append({"scenario": "startup"})
+        print(f"  {'startup':<14}       p50 {delta:+.1%}{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load benchmark for the Architect 3D Home Modeler.")
+    parser.add_argument("--url", help="Benchmark a running server instead of the in-process app.")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma-separated subset of: " + ", ".join(SCENARIOS))
+    parser.add_argument("--concurrency", default="1,4,16", help="Comma-separated concurrency levels.")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per scenario and concurrency level.")
+    parser.add_argument("--seed-renders", type=int, default=8, help="Renderings seeded per simulated user.")
+    parser.add_argument("--render-timeout", type=float, default=120, help="Seconds to wait for queued renders (0 skips end-to-end timing).")
+    parser.add_argument("--fake-latency-ms", type=int, default=200, help="In-process FakeBackend latency.")
+    parser.add_argument("--fake-jitter-ms", type=int, default=50)
+    parser.add_argument("--fake-failure-rate", type=float, default=0.0)
+    parser.add_argument("--keep-rate-limits", action="store_true", help="In-process: keep the app's render rate limits instead of lifting them.")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--startup-runs", type=int, default=0, help="Also time N cold starts in fresh interpreters.")
+    parser.add_argument("--out", help="Result file (default: bench_results/bench-<timestamp>.json).")
+    parser.add_argument("--baseline", help="Earlier result file to compare against.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed p95/throughput regression before failing.")
+    args = parser.parse_args(argv)
+
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown: parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    levels = [int(c) for c in args.concurrency.split(",")]
+
+    # Cold starts run first, before this process has imported anything heavy.
+    startup = run_startup(args.startup_runs) if args.startup_runs else None
+
+    app_module = None
+    if not scenarios:
+        client_factory = None
+    elif args.url:
+        client_factory = lambda: HttpClient(args.url)
+    else:
+        client_factory, app_module = make_inprocess_factory(args)
+
+    # One user per worker slot, seeded once and reused across levels.
+    workers = []
+    for _ in range(max(levels) if scenarios else 0):
+        client = client_factory()
+        login_new_user(client)
+        workers.append((client, seed_renderings(client, args.seed_renders, args.render_timeout or 120)))
+
+    results = []
+    for name in scenarios:
+        for level in levels:
+            results.append(run_level(name, workers[:level], args.requests, args))
+            if app_module is not None:
+                drain_render_queue(app_module, args.render_timeout or 120)
+            print(f"  {name} c={level}: p95 {results[-1]['p95_ms']} ms, {results[-1]['throughput_rps']} req/s", file=sys.stderr)
+
+    meta = {"timestamp": datetime.now().isoformat(timespec="seconds"), "git_revision": git_revision(),
+            "target": args.url or "in-process", "python": platform.python_version(),
+            "requests_per_level": args.requests, "seed_renders": args.seed_renders}
+    if not args.url:
+        meta["fake_backend"] = {"latency_ms": args.fake_latency_ms, "jitter_ms": args.fake_jitter_ms,
+                                "failure_rate": args.fake_failure_rate}
+    out = Path(args.out) if args.out else Path("bench_results") / f"bench-{datetime.now():%Y%m%d-%H%M%S}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps({"meta": meta, "results": results, "startup": startup}, indent=2))
+
+    if results: print_table(results)
+    if startup: print_startup(startup)
+    print(f"\nSaved {out}")
+    if args.baseline:
+        regressions = compare(results, json.loads(Path(args.baseline).read_text()), args.tolerance, startup)
+        if regressions:
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,7 +4,7 @@ document.addEventListener('DOMContentLoaded', function() {
     if (modal) {
         document.addEventListener('click', e => {
             if (e.target.classList.contains('modal-trigger')) {
-                modal.style.display = 'block'; document.getElementById('modalImg').src = e.target.src;
+                modal.style.display = 'block'; document.getElementById('modalImg').src = e.target.dataset.full || e.target.src;
             }
             if (e.target.classList.contains('close-modal')) {
                 modal.style.display = 'none';
@@ -63,6 +63,9 @@ document.addEventListener('DOMContentLoaded', function() {
         const activeCategoryInput = document.getElementById('active-category');
         const describeChangesTextarea = document.getElementById('describe-changes');
         const darkModeSwitch = document.getElementById('darkModeSwitch');
+        const searchInput = document.getElementById('gallery-search');
+        const facetFilters = document.getElementById('facet-filters');
+        const collapseToggle = document.getElementById('collapse-duplicates');
 
         function updateDisplay(category) {
             activeCategoryInput.value = category;
@@ -72,22 +75,15 @@ document.addEventListener('DOMContentLoaded', function() {
             });
 
             renderingTitle.textContent = `Renderings for ${category}`;
+            document.getElementById('export-category').href = `/export.zip?${new URLSearchParams({ scope: 'subcategory', subcategory: category })}`;
             optionsTitle.textContent = category;
             
             renderingGrid.innerHTML = '';
             optionsDropdowns.innerHTML = '';
-            
-            const renderings = ALL_RENDERINGS[category] || [];
-            if (renderings.length > 0) {
-                renderings.forEach(r => {
-                    const card = document.createElement('div');
-                    card.className = 'rendering-card-main';
-                    card.innerHTML = `<img src="/static/${r.image_path}" alt="${r.subcategory}">`;
-                    renderingGrid.appendChild(card);
-                });
-            } else {
-                renderingGrid.innerHTML = `<p class="no-renderings-msg">No renderings yet for ${category}. Use the panel on the right to generate one!</p>`;
-            }
+            searchInput.value = '';
+            resetPaging(category, '', {}, collapseToggle.checked);
+            loadNextPage();
+            loadFacets();
 
             const options = ALL_OPTIONS[category] || {};
             if (Object.keys(options).length > 0) {
@@ -110,12 +106,144 @@ document.addEventListener('DOMContentLoaded', function() {
             } else {
                 optionsDescription.textContent = "";
             }
+        }
 
-            document.querySelectorAll('.rendering-card-main img').forEach(img => {
-                img.classList.toggle('dark', darkModeSwitch.checked);
+        // --- Infinite scroll: fetch one keyset page of cards at a time ---
+        const PAGE_SIZE = 24;
+        const sentinel = document.getElementById('rendering-sentinel');
+        let paging = { category: null, q: '', options: {}, collapse: false, cursor: null, done: false, loading: false, generation: 0 };
+
+        function resetPaging(category, q = '', options = {}, collapse = false) {
+            paging = { category, q, options, collapse, cursor: null, done: false, loading: false, generation: paging.generation + 1 };
+        }
+
+        function isFiltered() {
+            return Boolean(paging.q) || Object.keys(paging.options).length > 0;
+        }
+
+        function filterParams() {
+            const params = new URLSearchParams({ subcategory: paging.category });
+            if (paging.q) params.set('q', paging.q);
+            if (paging.collapse) params.set('collapse', '1');
+            for (const [name, value] of Object.entries(paging.options)) params.append('option', `${name}:${value}`);
+            return params;
+        }
+
+        function renderingCard(r) {
+            const card = document.createElement('div');
+            card.className = 'rendering-card-main';
+            card.dataset.id = r.id;
+            card.innerHTML = `<img src="${derivedUrl(r.image_path, 640)}" srcset="${imageSrcset(r.image_path)}"
+                sizes="(max-width: 900px) 100vw, 50vw" loading="lazy" alt="${r.subcategory}">
+                <button type="button" class="similar-btn" title="Find similar renders">Similar</button>`;
+            card.querySelector('.similar-btn').addEventListener('click', () => showSimilar(r.id));
+            card.querySelector('img').classList.toggle('dark', darkModeSwitch.checked);
+            return card;
+        }
+
+        async function loadNextPage() {
+            if (paging.loading || paging.done) return;
+            const generation = paging.generation;
+            paging.loading = true;
+            const params = filterParams();
+            params.set('limit', PAGE_SIZE);
+            if (paging.cursor) params.set('cursor', paging.cursor);
+            try {
+                const response = await fetch(`/api/renderings?${params}`);
+                const page = await response.json();
+                if (!response.ok) throw new Error(page.error);
+                if (generation !== paging.generation) return;
+                page.items.forEach(r => renderingGrid.appendChild(renderingCard(r)));
+                paging.cursor = page.next_cursor;
+                paging.done = !page.next_cursor;
+                if (!renderingGrid.children.length) {
+                    renderingGrid.innerHTML = isFiltered()
+                        ? `<p class="no-renderings-msg">No renderings for ${paging.category} match these filters.</p>`
+                        : `<p class="no-renderings-msg">No renderings yet for ${paging.category}. Use the panel on the right to generate one!</p>`;
+                }
+            } catch (error) {
+                showFlash(`Could not load renderings: ${error.message}`, 'danger');
+                paging.done = true;
+            } finally {
+                if (generation === paging.generation) paging.loading = false;
+            }
+            if (!paging.done && generation === paging.generation && sentinelVisible()) loadNextPage();
+        }
+
+        function sentinelVisible() {
+            const container = document.getElementById('main-content').getBoundingClientRect();
+            return sentinel.getBoundingClientRect().top <= container.bottom;
+        }
+
+        new IntersectionObserver(entries => {
+            if (entries.some(e => e.isIntersecting)) loadNextPage();
+        }, { root: document.getElementById('main-content'), rootMargin: '400px' }).observe(sentinel);
+
+        // --- Search and facets: each option gets a select annotated with match counts ---
+        async function loadFacets() {
+            const generation = paging.generation;
+            try {
+                const response = await fetch(`/api/renderings/facets?${filterParams()}`);
+                const facets = await response.json();
+                if (!response.ok) throw new Error(facets.error);
+                if (generation !== paging.generation) return;
+                facetFilters.innerHTML = '';
+                for (const [name, values] of Object.entries(ALL_OPTIONS[paging.category] || {})) {
+                    const counts = facets.options[name] || {};
+                    const selected = paging.options[name] || '';
+                    const select = document.createElement('select');
+                    select.dataset.option = name;
+                    select.innerHTML = `<option value="">Any ${name}</option>` + values.map(v =>
+                        `<option value="${v}"${v === selected ? ' selected' : ''}>${v} (${counts[v] || 0})</option>`).join('');
+                    facetFilters.appendChild(select);
+                }
+            } catch (error) {
+                showFlash(`Could not load filters: ${error.message}`, 'danger');
+            }
+        }
+
+        function applyFilters() {
+            const options = {};
+            facetFilters.querySelectorAll('select').forEach(select => {
+                if (select.value) options[select.dataset.option] = select.value;
             });
+            renderingTitle.textContent = `Renderings for ${paging.category}`;
+            renderingGrid.innerHTML = '';
+            resetPaging(paging.category, searchInput.value.trim(), options, collapseToggle.checked);
+            loadNextPage();
+            loadFacets();
         }
 
+        // Similar renders replace the grid until a filter or room is picked again.
+        async function showSimilar(id) {
+            resetPaging(paging.category, paging.q, paging.options, paging.collapse);
+            paging.done = true;
+            paging.similarTo = id;
+            const generation = paging.generation;
+            try {
+                const response = await fetch(`/api/renderings/${id}/similar`);
+                const result = await response.json();
+                if (!response.ok) throw new Error(result.error);
+                if (generation !== paging.generation) return;
+                renderingTitle.textContent = `Renders similar to #${id}`;
+                renderingGrid.innerHTML = '';
+                result.items.forEach(r => renderingGrid.appendChild(renderingCard(r)));
+                if (!result.items.length) {
+                    renderingGrid.innerHTML = `<p class="no-renderings-msg">No similar renders found.</p>`;
+                }
+            } catch (error) {
+                showFlash(`Could not find similar renders: ${error.message}`, 'danger');
+            }
+        }
+
+        let searchTimer = null;
+        searchInput.addEventListener('input', () => {
+            clearTimeout(searchTimer);
+            searchTimer = setTimeout(applyFilters, 300);
+        });
+        facetFilters.addEventListener('change', applyFilters);
+        collapseToggle.addEventListener('change', applyFilters);
+
         navLinks.forEach(link => {
             link.addEventListener('click', (e) => {
                 e.preventDefault();
@@ -127,23 +255,62 @@ document.addEventListener('DOMContentLoaded', function() {
             e.preventDefault();
             const formData = new FormData(modifyForm);
             const button = modifyForm.querySelector('button[type="submit"]');
-            button.textContent = 'Generating...';
             button.disabled = true;
-            document.getElementById('loadingOverlay').style.display = 'flex';
 
             try {
                 const response = await fetch('/generate_room', { method: 'POST', body: formData });
                 const result = await response.json();
                 if (!response.ok) throw new Error(result.error);
-                window.location.reload();
+                trackPendingJob(result.job_id, result.subcategory);
             } catch (error) {
-                alert(`Error: ${error.message}`);
-                document.getElementById('loadingOverlay').style.display = 'none';
-                button.textContent = 'Generate Rendering';
+                showFlash(`Error: ${error.message}`, 'danger');
+            } finally {
                 button.disabled = false;
             }
         });
-        
+
+        // --- Live render progress: placeholders become cards as jobs finish ---
+        function pendingCard(jobId, subcategory) {
+            const card = document.createElement('div');
+            card.className = 'rendering-card-main pending-card';
+            card.dataset.jobId = jobId;
+            card.innerHTML = `<div class="pending-status">Queued: ${subcategory}</div>`;
+            return card;
+        }
+
+        function addRenderingCards(renderings) {
+            // Live cards can't be checked against a search, so a filtered view picks them up on the next reload.
+            if (isFiltered() || paging.similarTo) return;
+            renderings.filter(r => r.subcategory === paging.category && !(paging.collapse && r.duplicate_of)).forEach(r => {
+                if (renderingGrid.querySelector(`[data-id="${r.id}"]`)) return;
+                renderingGrid.querySelector('.no-renderings-msg')?.remove();
+                renderingGrid.prepend(renderingCard(r));
+            });
+        }
+
+        function trackPendingJob(jobId, subcategory) {
+            if (subcategory === paging.category) {
+                renderingGrid.querySelector('.no-renderings-msg')?.remove();
+                renderingGrid.prepend(pendingCard(jobId, subcategory));
+            }
+            waitForJob(jobId).then(job => {
+                job.failures.forEach(f => showFlash(`${f.subcategory}: ${f.error}`, 'danger'));
+                const duplicates = job.renderings.filter(r => r.duplicate_of).length;
+                showFlash(`Rendered ${job.renderings.map(r => r.subcategory).join(', ')}.` +
+                    (duplicates ? ` ${duplicates} nearly identical to an earlier render.` : ''), 'success');
+            }).catch(error => {
+                showFlash(`Error: ${error.message}`, 'danger');
+            }).finally(() => {
+                renderingGrid.querySelector(`[data-job-id="${jobId}"]`)?.remove();
+            });
+        }
+
+        document.addEventListener('render:started', e => {
+            const status = renderingGrid.querySelector(`[data-job-id="${e.detail.id}"] .pending-status`);
+            if (status) status.textContent = status.textContent.replace('Queued', 'Rendering');
+        });
+        document.addEventListener('render:completed', e => addRenderingCards(e.detail.renderings));
+
         darkModeSwitch.addEventListener('change', () => {
             document.querySelectorAll('.rendering-card-main img').forEach(img => {
                 img.classList.toggle('dark', darkModeSwitch.checked);
@@ -166,9 +333,257 @@ document.addEventListener('DOMContentLoaded', function() {
         if (navLinks.length > 0) {
             updateDisplay('Front Exterior');
         }
+
+        if (typeof PENDING_JOBS !== 'undefined') {
+            PENDING_JOBS.forEach(id => trackPendingJob(id, null));
+        }
+    }
+
+    // --- Option Sweep Page: render every combination of the varied options and compare them ---
+    const sweepForm = document.getElementById('sweepForm');
+    if (sweepForm) {
+        const roomSelect = document.getElementById('sweep-room');
+        const optionsContainer = document.getElementById('sweep-options');
+        const summary = document.getElementById('sweep-summary');
+        const grid = document.getElementById('sweep-grid');
+        const STATUS_LABELS = { queued: 'Rendering…', deferred: 'Waiting for rate limit', pending: 'Not rendered yet' };
+        let sweepRun = 0;
+
+        function buildOptionRows() {
+            optionsContainer.innerHTML = '';
+            grid.innerHTML = '';
+            summary.textContent = '';
+            for (const [name, values] of Object.entries(ALL_OPTIONS[roomSelect.value] || {})) {
+                const row = document.createElement('fieldset');
+                row.className = 'sweep-option';
+                row.dataset.option = name;
+                const legend = document.createElement('legend');
+                legend.innerHTML = `<label><input type="checkbox" class="sweep-vary"> Vary <span></span></label>`;
+                legend.querySelector('span').textContent = name;
+                const fixed = document.createElement('select');
+                fixed.name = name;
+                fixed.add(new Option('Default', ''));
+                values.forEach(v => fixed.add(new Option(v, v)));
+                const choices = document.createElement('div');
+                choices.className = 'sweep-values';
+                choices.hidden = true;
+                values.forEach(v => {
+                    const label = document.createElement('label');
+                    const box = document.createElement('input');
+                    box.type = 'checkbox';
+                    box.value = v;
+                    box.checked = true;
+                    label.append(box, ` ${v}`);
+                    choices.appendChild(label);
+                });
+                legend.querySelector('.sweep-vary').addEventListener('change', e => {
+                    // A disabled select drops out of the form data, so a varied option is never also sent fixed.
+                    fixed.hidden = fixed.disabled = e.target.checked;
+                    choices.hidden = !e.target.checked;
+                });
+                row.append(legend, fixed, choices);
+                optionsContainer.appendChild(row);
+            }
+        }
+
+        function sweepFormData(dryRun) {
+            const data = new FormData(sweepForm);
+            optionsContainer.querySelectorAll('.sweep-option').forEach(row => {
+                if (!row.querySelector('.sweep-vary').checked) return;
+                row.querySelectorAll('.sweep-values input:checked').forEach(box => {
+                    data.append('vary', `${row.dataset.option}:${box.value}`);
+                });
+            });
+            if (dryRun) data.set('dry_run', '1');
+            return data;
+        }
+
+        function sweepCell(variant) {
+            const cell = document.createElement('td');
+            if (variant?.rendering) {
+                const img = document.createElement('img');
+                img.src = derivedUrl(variant.rendering.image_path, 640);
+                img.dataset.full = `/static/${variant.rendering.image_path}`;
+                img.className = 'modal-trigger';
+                img.loading = 'lazy';
+                img.alt = Object.values(variant.options).join(', ');
+                cell.appendChild(img);
+            } else {
+                const status = document.createElement('div');
+                status.className = 'sweep-status';
+                status.textContent = STATUS_LABELS[variant?.status] || '';
+                cell.appendChild(status);
+            }
+            return cell;
+        }
+
+        // The last two axes form the rows and columns of a table; any earlier axes get one table per combination.
+        function renderSweepGrid(result) {
+            const names = Object.keys(result.axes);
+            const colName = names[names.length - 1];
+            const rowName = names.length > 1 ? names[names.length - 2] : null;
+            const groupNames = names.slice(0, Math.max(0, names.length - 2));
+            const groups = new Map();
+            result.variants.forEach(v => {
+                const title = groupNames.map(n => `${n}: ${v.options[n]}`).join(' · ');
+                if (!groups.has(title)) groups.set(title, []);
+                groups.get(title).push(v);
+            });
+            grid.innerHTML = '';
+            for (const [title, variants] of groups) {
+                if (title) {
+                    const heading = document.createElement('h3');
+                    heading.textContent = title;
+                    grid.appendChild(heading);
+                }
+                const table = document.createElement('table');
+                table.className = 'sweep-table';
+                const header = table.createTHead().insertRow();
+                header.appendChild(document.createElement('th')).textContent = rowName ? `${rowName} \\ ${colName}` : colName;
+                result.axes[colName].forEach(c => { header.appendChild(document.createElement('th')).textContent = c; });
+                const body = table.createTBody();
+                (rowName ? result.axes[rowName] : [null]).forEach(r => {
+                    const row = body.insertRow();
+                    row.appendChild(document.createElement('th')).textContent = r ?? '';
+                    result.axes[colName].forEach(c => {
+                        row.appendChild(sweepCell(variants.find(v => v.options[colName] === c && (!rowName || v.options[rowName] === r))));
+                    });
+                });
+                grid.appendChild(table);
+            }
+        }
+
+        function sweepSummary(result) {
+            const parts = [`${result.variants.length} variants`, `${result.rendered} rendered`];
+            if (result.queued) parts.push(`${result.queued} rendering`);
+            if (result.deferred) parts.push(`${result.deferred} waiting for the rate limit`);
+            if (result.pending) parts.push(`${result.pending} to render (${result.cached} from cache)`);
+            return parts.join(', ') + '.';
+        }
+
+        // Re-posting the same sweep is idempotent: rendered and in-flight variants are skipped,
+        // so each round picks up whatever the rate limit deferred last time.
+        async function runSweep(dryRun) {
+            const run = ++sweepRun;
+            const response = await fetch('/sweep', { method: 'POST', body: sweepFormData(dryRun) });
+            const result = await response.json();
+            if (run !== sweepRun) return;
+            if (!response.ok) {
+                const retryAfter = parseInt(response.headers.get('Retry-After') || '0', 10);
+                if (response.status !== 429 || !retryAfter || dryRun) throw new Error(result.error);
+                summary.textContent = `${result.error} Continuing automatically.`;
+                setTimeout(() => { if (run === sweepRun) runSweep(false).catch(reportError); }, retryAfter * 1000);
+                return;
+            }
+            renderSweepGrid(result);
+            summary.textContent = sweepSummary(result);
+            if (dryRun || !result.job_ids.length) return;
+            // Wait on every job still producing one of these variants, not just the one this round started.
+            let progressed = false;
+            (await Promise.allSettled(result.job_ids.map(waitForJob))).forEach(outcome => {
+                if (outcome.status === 'rejected') return reportError(outcome.reason);
+                outcome.value.failures.forEach(f => showFlash(`${f.subcategory}: ${f.error}`, 'danger'));
+                progressed ||= outcome.value.renderings.length > 0;
+            });
+            // Stop once a round renders nothing, so a variant that keeps failing isn't retried forever.
+            if (run === sweepRun) await runSweep(!progressed);
+        }
+
+        function reportError(error) {
+            showFlash(`Error: ${error.message}`, 'danger');
+        }
+
+        roomSelect.addEventListener('change', buildOptionRows);
+        document.getElementById('sweep-preview').addEventListener('click', () => runSweep(true).catch(reportError));
+        sweepForm.addEventListener('submit', e => {
+            e.preventDefault();
+            runSweep(false).catch(reportError);
+        });
+        buildOptionRows();
     }
 });
 
+// Gallery cards use resized derivatives; the full PNG is only loaded on demand.
+function derivedUrl(imagePath, width) {
+    return `/derived/${width}/${imagePath}`;
+}
+
+function imageSrcset(imagePath) {
+    return RESPONSIVE_WIDTHS.map(w => `${derivedUrl(imagePath, w)} ${w}w`).join(', ');
+}
+
+// --- Render progress over Server-Sent Events ---
+// While a page waits on jobs, one EventSource carries queued/started/completed/failed
+// events for all of this visitor's jobs. Each open stream holds a server worker, so
+// it is closed once nothing is awaited; when the server ends it (no active jobs or
+// SSE_MAX_SECONDS reached) the remaining jobs are polled instead of reconnecting.
+// Browsers without EventSource always poll.
+const JOB_POLL_INTERVAL_MS = 2000;
+const RENDER_EVENT_TYPES = ['queued', 'started', 'completed', 'failed'];
+const jobWaiters = new Map();
+let renderEvents = null;
+
+function openRenderEvents() {
+    if (!renderEvents) {
+        renderEvents = new EventSource('/events/renders');
+        RENDER_EVENT_TYPES.forEach(type => {
+            renderEvents.addEventListener(type, e => handleRenderEvent(type, JSON.parse(e.data)));
+        });
+        renderEvents.addEventListener('error', () => {
+            closeRenderEvents();
+            for (const [jobId, waiter] of jobWaiters) {
+                jobWaiters.delete(jobId);
+                pollJob(`/jobs/${jobId}`).then(waiter.resolve, waiter.reject);
+            }
+        });
+    }
+    return renderEvents;
+}
+
+function closeRenderEvents() {
+    if (renderEvents) {
+        renderEvents.close();
+        renderEvents = null;
+    }
+}
+
+function handleRenderEvent(type, job) {
+    document.dispatchEvent(new CustomEvent(`render:${type}`, { detail: job }));
+    const waiter = jobWaiters.get(job.id);
+    if (!waiter || (type !== 'completed' && type !== 'failed')) return;
+    jobWaiters.delete(job.id);
+    if (!jobWaiters.size) closeRenderEvents();
+    if (type === 'completed') waiter.resolve(job);
+    else waiter.reject(new Error(job.error || 'Rendering failed.'));
+}
+
+function waitForJob(jobId) {
+    if (!window.EventSource) return pollJob(`/jobs/${jobId}`);
+    return new Promise((resolve, reject) => {
+        jobWaiters.set(jobId, { resolve, reject });
+        openRenderEvents();
+        // The job may have finished before the stream connected.
+        fetch(`/jobs/${jobId}`).then(r => r.json()).then(job => {
+            if (job.status === 'done') handleRenderEvent('completed', job);
+            else if (job.status === 'failed') handleRenderEvent('failed', job);
+        }).catch(() => {});
+    });
+}
+
+async function pollJob(statusUrl) {
+    while (true) {
+        const response = await fetch(statusUrl);
+        const job = await response.json();
+        if (!response.ok) throw new Error(job.error);
+        if (job.status === 'done') {
+            document.dispatchEvent(new CustomEvent('render:completed', { detail: job }));
+            return job;
+        }
+        if (job.status === 'failed') throw new Error(job.error || 'Rendering failed.');
+        await new Promise(resolve => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+    }
+}
+
 function showFlash(message, category) {
     const container = document.getElementById('flash-container');
     const flash = document.createElement('div');
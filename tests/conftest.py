@@ -0,0 +1,45 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+os.environ.setdefault("INIT_ON_STARTUP", "0")
+os.environ.setdefault("MAINTENANCE_ENABLED", "0")
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import app as architect  # noqa: E402
+
+
+class FakeClock:
+    """Stands in for time.monotonic; tests move it forward explicitly."""
+
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    """A fresh database and static tree under tmp_path, with an app context for get_db()."""
+    static = tmp_path / "static"
+    monkeypatch.setattr(architect, "DB_PATH", tmp_path / "architect.db")
+    monkeypatch.setattr(architect, "UPLOAD_DIR", tmp_path / "uploads")
+    monkeypatch.setattr(architect, "STATIC_DIR", static)
+    monkeypatch.setattr(architect, "RENDER_DIR", static / "renderings")
+    monkeypatch.setattr(architect, "RENDER_CACHE_DIR", tmp_path / "render_cache")
+    monkeypatch.setattr(architect, "DERIVED_DIR", tmp_path / "derived")
+    monkeypatch.setattr(architect.app, "static_folder", str(static))
+    architect.init_storage()
+    with architect.app.app_context():
+        yield architect.get_db()
@@ -0,0 +1,59 @@
+import pytest
+
+import app as architect
+from app import decode_cursor, encode_cursor
+
+
+def test_cursor_round_trips():
+    row = {"created_at": "2024-05-01T12:30:00.123456", "id": 42}
+    assert decode_cursor(encode_cursor(row)) == ("2024-05-01T12:30:00.123456", 42)
+
+
+@pytest.mark.parametrize("cursor", ["", "42", "|42", "2024-05-01|", "2024-05-01|x", "2024-05-01|-1", "2024-05-01|4.2"])
+def test_malformed_cursors_are_rejected(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+@pytest.fixture
+def client(storage):
+    for n in range(7):
+        # Pairs of rows share a timestamp so pages have to break ties on id.
+        storage.execute(
+            "INSERT INTO renderings (user_id, category, subcategory, options_json, prompt, image_path, created_at)"
+            " VALUES (?, 'EXTERIOR', 'Front Exterior', '{}', 'p', ?, ?)",
+            (1, f"renderings/{n}.png", f"2024-01-0{1 + n // 2}T00:00:00"))
+    storage.execute(
+        "INSERT INTO renderings (user_id, category, subcategory, options_json, prompt, image_path, created_at)"
+        " VALUES (2, 'EXTERIOR', 'Front Exterior', '{}', 'p', 'renderings/other.png', '2024-01-09T00:00:00')")
+    storage.commit()
+    client = architect.app.test_client()
+    with client.session_transaction() as sess:
+        sess["user_id"] = 1
+    return client
+
+
+def test_pages_walk_the_history_newest_first_without_gaps(client):
+    seen, cursor = [], None
+    while True:
+        query = {"limit": 3, **({"cursor": cursor} if cursor else {})}
+        page = client.get("/api/renderings", query_string=query).get_json()
+        seen += [item["id"] for item in page["items"]]
+        cursor = page["next_cursor"]
+        if not cursor: break
+    assert seen == [7, 6, 5, 4, 3, 2, 1]
+
+
+def test_a_row_added_mid_walk_does_not_shift_later_pages(client, storage):
+    first = client.get("/api/renderings", query_string={"limit": 3}).get_json()
+    storage.execute(
+        "INSERT INTO renderings (user_id, category, subcategory, options_json, prompt, image_path, created_at)"
+        " VALUES (1, 'EXTERIOR', 'Front Exterior', '{}', 'p', 'renderings/new.png', '2024-02-01T00:00:00')")
+    storage.commit()
+    second = client.get("/api/renderings", query_string={"limit": 3, "cursor": first["next_cursor"]}).get_json()
+    assert [item["id"] for item in second["items"]] == [4, 3, 2]
+
+
+def test_bad_cursor_is_a_400(client):
+    response = client.get("/api/renderings", query_string={"cursor": "garbage"})
+    assert response.status_code == 400
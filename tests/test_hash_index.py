@@ -0,0 +1,112 @@
+from io import BytesIO
+
+import pytest
+from PIL import Image, ImageDraw
+
+import app as architect
+from app import HashIndex, hash_distance, image_hashes
+
+
+def _insert(db, hashes, user_id=None, guest_token=None, deleted=False):
+    cur = db.execute(
+        "INSERT INTO renderings (user_id, guest_token, category, subcategory, options_json, prompt, image_path, created_at,"
+        " dhash, phash, deleted_at) VALUES (?, ?, 'EXTERIOR', 'Front Exterior', '{}', 'p', 'renderings/x.png', '2024-01-01', ?, ?, ?)",
+        (user_id, guest_token, *hashes, "2024-01-02" if deleted else None))
+    db.commit()
+    return cur.lastrowid
+
+
+def _bits(n: int) -> int:
+    """A hash differing from 0 in its lowest n bits."""
+    return (1 << n) - 1
+
+
+@pytest.fixture
+def index(storage):
+    return HashIndex()
+
+
+def test_search_orders_by_distance_then_age(storage, index):
+    far = _insert(storage, (_bits(3), _bits(3)), user_id=1)
+    near = _insert(storage, (_bits(1), 0), user_id=1)
+    tie = _insert(storage, (0, _bits(1)), user_id=1)
+    exact = _insert(storage, (0, 0), user_id=1)
+    assert index.search(1, None, (0, 0), max_distance=64, limit=10) == [(exact, 0), (near, 1), (tie, 1), (far, 6)]
+    assert index.search(1, None, (0, 0), max_distance=1, limit=2) == [(exact, 0), (near, 1)]
+
+
+def test_search_is_scoped_to_the_owner(storage, index):
+    mine = _insert(storage, (0, 0), user_id=1)
+    _insert(storage, (0, 0), user_id=2)
+    guest = _insert(storage, (0, 0), guest_token="g1")
+    _insert(storage, (0, 0), guest_token="g2")
+    _insert(storage, (0, 0))
+    assert index.search(1, None, (0, 0), 64, 10) == [(mine, 0)]
+    assert index.search(None, "g1", (0, 0), 64, 10) == [(guest, 0)]
+    assert index.search(None, "unknown", (0, 0), 64, 10) == []
+
+
+def test_renders_without_an_owner_never_match(storage, index):
+    _insert(storage, (0, 0))
+    _insert(storage, (0, 0))
+    assert index.search(None, None, (0, 0), 64, 10) == []
+
+
+def test_search_excludes_given_ids(storage, index):
+    a = _insert(storage, (0, 0), user_id=1)
+    b = _insert(storage, (0, 0), user_id=1)
+    assert index.search(1, None, (0, 0), 64, 10, exclude=(a,)) == [(b, 0)]
+
+
+def test_search_handles_hashes_with_the_sign_bit_set(storage, index):
+    # SQLite stores hashes as signed 64-bit ints; distance must count bits, not magnitudes.
+    rid = _insert(storage, (-1, -(1 << 63)), user_id=1)
+    assert index.search(1, None, (0, 0), 128, 10) == [(rid, 65)]
+    assert hash_distance((-1, -(1 << 63)), (0, 0)) == 65
+
+
+def test_refresh_picks_up_new_renders_incrementally(storage, index):
+    first = _insert(storage, (0, 0), user_id=1)
+    assert index.search(1, None, (0, 0), 64, 10) == [(first, 0)]
+    second = _insert(storage, (0, 0), guest_token="g1")
+    index.refresh()
+    assert index.search(None, "g1", (0, 0), 64, 10) == [(second, 0)]
+
+
+def test_deleted_renders_drop_out_on_rebuild(storage, index):
+    rid = _insert(storage, (0, 0), user_id=1)
+    _insert(storage, (0, 0), user_id=1, deleted=True)
+    assert index.search(1, None, (0, 0), 64, 10) == [(rid, 0)]
+    storage.execute("UPDATE renderings SET deleted_at = '2024-01-03' WHERE id = ?", (rid,))
+    storage.commit()
+    index.refresh(rebuild=True)
+    assert index.search(1, None, (0, 0), 64, 10) == []
+
+
+def test_reassign_guest_moves_renders_to_the_account(storage, index):
+    rid = _insert(storage, (0, 0), guest_token="g1")
+    index.refresh()
+    index.reassign_guest("g1", 7)
+    assert index.search(7, None, (0, 0), 64, 10, refresh=False) == [(rid, 0)]
+    assert index.search(None, "g1", (0, 0), 64, 10, refresh=False) == []
+
+
+def _png(draw_extra=False) -> bytes:
+    img = Image.new("RGB", (640, 360), "white")
+    draw = ImageDraw.Draw(img)
+    draw.rectangle([80, 60, 360, 300], fill="navy")
+    draw.ellipse([400, 80, 600, 280], fill="darkred")
+    if draw_extra:
+        draw.rectangle([10, 10, 14, 14], fill="black")
+    buf = BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def test_image_hashes_are_close_for_near_identical_images():
+    base = image_hashes(_png())
+    assert hash_distance(base, image_hashes(_png(draw_extra=True))) <= architect.DUPLICATE_MAX_DISTANCE
+    flipped = Image.open(BytesIO(_png())).transpose(Image.Transpose.FLIP_TOP_BOTTOM)
+    buf = BytesIO()
+    flipped.save(buf, format="PNG")
+    assert hash_distance(base, image_hashes(buf.getvalue())) > architect.DUPLICATE_MAX_DISTANCE
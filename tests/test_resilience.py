@@ -0,0 +1,228 @@
+import pytest
+
+import app as architect
+from app import BackendUnavailable, CircuitBreaker, ImageBackend, RateLimited, RateLimiter, TokenBucket
+
+
+# ---------- TokenBucket ----------
+
+def test_bucket_starts_full_and_refills_at_rate():
+    bucket = TokenBucket(rate=2, burst=4, now=0)
+    assert bucket.take(4, now=0) == 0
+    assert bucket.take(1, now=0) == pytest.approx(0.5)
+    assert bucket.take(1, now=0.5) == 0
+
+
+def test_bucket_refill_is_capped_at_burst():
+    bucket = TokenBucket(rate=2, burst=4, now=0)
+    bucket.take(4, now=0)
+    bucket.take(0, now=3600)
+    assert bucket.tokens == 4
+
+
+def test_bucket_never_fits_more_than_burst():
+    assert TokenBucket(rate=2, burst=4, now=0).take(5, now=0) == float("inf")
+    assert TokenBucket(rate=0, burst=4, now=0).take(4, now=0) == 0
+
+
+def test_bucket_give_is_capped_at_burst():
+    bucket = TokenBucket(rate=1, burst=3, now=0)
+    bucket.take(1, now=0)
+    bucket.give(5)
+    assert bucket.tokens == 3
+
+
+# ---------- RateLimiter ----------
+
+def test_limiter_rejects_over_user_burst_with_retry_after(clock):
+    limiter = RateLimiter(60, 2, 600, 100, clock=clock)  # one user token per second
+    limiter.admit("user:1", 2)
+    with pytest.raises(RateLimited) as e:
+        limiter.admit("user:1")
+    assert e.value.status == 429
+    assert e.value.retry_after == pytest.approx(1)
+    clock.advance(1)
+    limiter.admit("user:1")
+
+
+def test_limiter_keeps_callers_apart(clock):
+    limiter = RateLimiter(60, 1, 600, 100, clock=clock)
+    limiter.admit("user:1")
+    limiter.admit("user:2")
+    with pytest.raises(RateLimited):
+        limiter.admit("user:1")
+
+
+def test_limiter_global_rejection_refunds_the_user_bucket(clock):
+    limiter = RateLimiter(60, 5, 60, 2, clock=clock)
+    limiter.admit("user:1", 2)
+    with pytest.raises(RateLimited, match="busy"):
+        limiter.admit("user:2")
+    assert limiter.buckets["user:2"].tokens == 5
+
+
+def test_limiter_request_larger_than_burst_can_never_fit(clock):
+    limiter = RateLimiter(60, 3, 600, 100, clock=clock)
+    with pytest.raises(RateLimited, match="at most 3"):
+        limiter.admit("user:1", 4)
+
+
+def test_admit_up_to_takes_what_fits(clock):
+    limiter = RateLimiter(60, 5, 600, 100, clock=clock)
+    assert limiter.admit_up_to("user:1", 8) == 5
+    with pytest.raises(RateLimited):
+        limiter.admit_up_to("user:1", 8)
+    clock.advance(2.5)
+    assert limiter.admit_up_to("user:1", 8) == 2
+    assert limiter.buckets["user:1"].tokens == pytest.approx(0.5)
+
+
+def test_admit_up_to_is_bounded_by_the_global_bucket(clock):
+    limiter = RateLimiter(60, 10, 60, 3, clock=clock)
+    assert limiter.admit_up_to("user:1", 8) == 3
+    assert limiter.buckets["user:1"].tokens == 7
+    assert limiter.global_bucket.tokens == 0
+
+
+def test_admit_up_to_never_charges_more_than_asked(clock):
+    limiter = RateLimiter(60, 10, 600, 100, clock=clock)
+    assert limiter.admit_up_to("user:1", 2) == 2
+    assert limiter.buckets["user:1"].tokens == 8
+
+
+# ---------- CircuitBreaker ----------
+
+def _fail(breaker, times=1):
+    for _ in range(times):
+        breaker.before_call()
+        breaker.record_failure()
+
+
+def test_breaker_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker(3, 30, clock=clock)
+    _fail(breaker, 2)
+    assert breaker.state == "closed"
+    _fail(breaker)
+    assert breaker.state == "open"
+    with pytest.raises(BackendUnavailable) as e:
+        breaker.before_call()
+    assert e.value.retry_after == pytest.approx(30)
+    assert breaker.retry_after() == pytest.approx(30)
+
+
+def test_breaker_success_resets_the_failure_count(clock):
+    breaker = CircuitBreaker(3, 30, clock=clock)
+    _fail(breaker, 2)
+    breaker.before_call()
+    breaker.record_success()
+    _fail(breaker, 2)
+    assert breaker.state == "closed"
+
+
+def test_breaker_half_opens_for_a_single_trial(clock):
+    breaker = CircuitBreaker(1, 30, clock=clock)
+    _fail(breaker)
+    clock.advance(29)
+    assert breaker.retry_after() == pytest.approx(1)
+    clock.advance(1)
+    assert breaker.retry_after() is None
+    breaker.before_call()
+    assert breaker.state == "half_open"
+    assert breaker.retry_after() == 1.0
+    with pytest.raises(BackendUnavailable, match="recovering"):
+        breaker.before_call()
+
+
+def test_breaker_closes_when_the_trial_succeeds(clock):
+    breaker = CircuitBreaker(1, 30, clock=clock)
+    _fail(breaker)
+    clock.advance(30)
+    breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.failures == 0
+    breaker.before_call()
+
+
+def test_breaker_reopens_when_the_trial_fails(clock):
+    breaker = CircuitBreaker(5, 30, clock=clock)
+    _fail(breaker, 5)
+    clock.advance(30)
+    _fail(breaker)
+    assert breaker.state == "open"
+    assert breaker.retry_after() == pytest.approx(30)
+
+
+# ---------- Backoff and call_backend ----------
+
+def test_backoff_delay_grows_exponentially_up_to_the_cap(monkeypatch):
+    monkeypatch.setattr(architect, "BACKEND_RETRY_BASE_SECONDS", 1.0)
+    monkeypatch.setattr(architect, "BACKEND_RETRY_MAX_SECONDS", 20.0)
+    bounds = []
+    monkeypatch.setattr(architect.random, "uniform", lambda low, high: bounds.append((low, high)) or high)
+    assert [architect.backoff_delay(attempt) for attempt in range(7)] == [1, 2, 4, 8, 16, 20, 20]
+    assert all(low == 0 for low, _ in bounds)
+
+
+class ScriptedBackend(ImageBackend):
+    """Raises the queued exceptions in order, then returns PNG bytes."""
+    name = "scripted"
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def generate(self, prompt, negative_prompt, aspect_ratio=architect.RENDER_ASPECT_RATIO, base_image=None):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return b"png"
+
+
+@pytest.fixture
+def breaker(monkeypatch, clock):
+    breaker = CircuitBreaker(100, 30, clock=clock)
+    monkeypatch.setattr(architect, "backend_breaker", breaker)
+    monkeypatch.setattr(architect, "backoff_delay", lambda attempt: 0)
+    monkeypatch.setattr(architect, "BACKEND_MAX_RETRIES", 2)
+    return breaker
+
+
+def test_call_backend_retries_transient_errors(breaker):
+    backend = ScriptedBackend(ConnectionError("reset"), architect.ImageBackendError("429", retryable=True))
+    assert architect.call_backend(backend, "p", "n") == b"png"
+    assert backend.calls == 3
+    assert breaker.failures == 0
+
+
+def test_call_backend_gives_up_after_max_retries(breaker):
+    backend = ScriptedBackend(*[ConnectionError("reset")] * 4)
+    with pytest.raises(ConnectionError):
+        architect.call_backend(backend, "p", "n")
+    assert backend.calls == 3
+    assert breaker.failures == 3
+
+
+def test_call_backend_does_not_retry_bad_requests(breaker):
+    backend = ScriptedBackend(ValueError("prompt rejected"))
+    with pytest.raises(ValueError):
+        architect.call_backend(backend, "p", "n")
+    assert backend.calls == 1
+    assert breaker.state == "closed"
+
+
+def test_call_backend_fails_fast_while_the_breaker_is_open(breaker):
+    _fail(breaker, breaker.failure_threshold)
+    backend = ScriptedBackend()
+    with pytest.raises(BackendUnavailable):
+        architect.call_backend(backend, "p", "n")
+    assert backend.calls == 0
+
+
+def test_call_backend_labels_unknown_subcategories_as_other(breaker):
+    architect.call_backend(ScriptedBackend(), "p", "n", subcategory="Kitchen")
+    architect.call_backend(ScriptedBackend(), "p", "n", subcategory="Bogus Room 123")
+    samples = architect.BACKEND_LATENCY.samples()
+    assert any('subcategory="Kitchen"' in line for line in samples)
+    assert any('subcategory="other"' in line for line in samples)
+    assert not any("Bogus Room 123" in line for line in samples)
@@ -0,0 +1,24 @@
+import app as architect
+
+
+def test_generate_room_rejects_rooms_outside_the_catalog(storage):
+    client = architect.app.test_client()
+    response = client.post("/generate_room", data={"subcategory": "Bogus Room 123"})
+    assert response.status_code == 400
+    assert storage.execute("SELECT COUNT(*) FROM render_jobs").fetchone()[0] == 0
+
+
+def test_register_claims_renders_from_an_old_style_guest_cookie(storage):
+    for n in range(2):
+        storage.execute(
+            "INSERT INTO renderings (category, subcategory, options_json, prompt, image_path, created_at)"
+            " VALUES ('EXTERIOR', 'Front Exterior', '{}', 'p', ?, '2024-01-01T00:00:00')", (f"renderings/{n}.png",))
+    storage.commit()
+    client = architect.app.test_client()
+    with client.session_transaction() as sess:
+        sess["guest_rendering_ids"] = [1]
+    response = client.post("/register", data={"email": "new@example.com", "password": "secret"})
+    assert response.status_code == 302
+    user_id = storage.execute("SELECT id FROM users WHERE email = 'new@example.com'").fetchone()[0]
+    rows = storage.execute("SELECT id, user_id, guest_token FROM renderings ORDER BY id").fetchall()
+    assert [tuple(row) for row in rows] == [(1, user_id, None), (2, None, None)]
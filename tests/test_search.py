@@ -0,0 +1,40 @@
+import pytest
+
+import app as architect
+
+
+@pytest.fixture
+def client(storage):
+    rows = [(1, '{"Wall Color": "Warm Ivory"}', "Oak floors"),
+            (1, '{"Wall Color": "Slate"}', None),
+            (2, '{"Wall Color": "Warm Ivory"}', None)]
+    for n, (user_id, options, description) in enumerate(rows):
+        storage.execute(
+            "INSERT INTO renderings (user_id, category, subcategory, options_json, prompt, description, image_path, created_at)"
+            " VALUES (?, 'INTERIOR', 'Kitchen', ?, 'A photorealistic, professionally lit architectural rendering', ?, ?, ?)",
+            (user_id, options, description, f"renderings/{n}.png", f"2024-01-0{n + 1}T00:00:00"))
+    storage.commit()
+    client = architect.app.test_client()
+    with client.session_transaction() as sess:
+        sess["user_id"] = 1
+    return client
+
+
+def search(client, q):
+    return [item["id"] for item in client.get("/api/renderings", query_string={"q": q}).get_json()["items"]]
+
+
+def test_search_matches_the_callers_own_options_and_descriptions(client):
+    assert search(client, "warm") == [1]
+    assert search(client, "oak") == [1]
+    assert search(client, "slat") == [2]
+
+
+def test_search_ignores_the_shared_prompt_template(client):
+    assert search(client, "photorealistic") == []
+
+
+def test_search_follows_rows_to_their_new_owner(client, storage):
+    storage.execute("UPDATE renderings SET user_id = 1 WHERE id = 3")
+    storage.commit()
+    assert search(client, "warm") == [3, 1]